@@ -0,0 +1,50 @@
+"""
+Request pacing and retry timing shared by the Letterboxd scraper and the TMDb client.
+"""
+
+import asyncio
+import os
+import random
+import time
+
+# Upper bound on how long a 429's Retry-After may stall one fetch.
+MAX_RETRY_AFTER = float(os.getenv("SCRAPE_MAX_RETRY_AFTER", "60"))
+
+
+def retry_after_seconds(headers) -> float | None:
+    """Seconds a 429's Retry-After header asks for, or None if absent or not a number."""
+    try:
+        return max(0.0, float(headers.get('Retry-After', '')))
+    except (TypeError, ValueError):
+        return None  # absent, or an HTTP-date - fall back to our own backoff
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Exponential backoff with jitter, stretched to a 429's Retry-After when it asks for longer."""
+    delay = (1.2 * (2 ** attempt)) + random.random() * 1.5
+    if retry_after:
+        delay = max(delay, min(retry_after, MAX_RETRY_AFTER))
+    return delay
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, after an initial `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens are handed out first come, first served
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
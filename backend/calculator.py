@@ -20,13 +20,16 @@ Control points (watches -> score):
 - 3K   watches -> 98  (extremely obscure)
 """
 
+from bisect import bisect_right
 from collections import Counter
+from heapq import nlargest, nsmallest
+from statistics import median, median_high
 import math
 
 
 # Control points: (watches, score) - carefully tuned for score diversity
 # More granular in the 500K-2M range where most viewers fall
-SCORE_CURVE = [
+SCORE_CURVE = (
     (5_000_000, 5),
     (3_500_000, 10),
     (2_500_000, 18),
@@ -45,7 +48,26 @@ SCORE_CURVE = [
     (10_000, 94),
     (5_000, 97),
     (1_000, 99),
-]
+)
+
+# SCORE_CURVE ascending by watches, for bisect lookups.
+_CURVE_WATCHES = tuple(w for w, _ in reversed(SCORE_CURVE))
+_CURVE_SCORES = tuple(s for _, s in reversed(SCORE_CURVE))
+
+# Per-segment constants for segment i: (lower_watches, upper_watches, watch_span, upper_score,
+# score_drop), so interpolation is a single tuple unpack plus one divide and one multiply-add.
+_SEGMENTS = (None,) + tuple(
+    (_CURVE_WATCHES[i - 1], _CURVE_WATCHES[i], _CURVE_WATCHES[i] - _CURVE_WATCHES[i - 1],
+     _CURVE_SCORES[i], _CURVE_SCORES[i - 1] - _CURVE_SCORES[i])
+    for i in range(1, len(_CURVE_WATCHES))
+)
+
+# Decade labels for every plausible release year (formatted on the fly outside this range)
+_DECADE_STR = {y: f"{(y // 10) * 10}s" for y in range(1870, 2040)}
+
+# Curve endpoints: at or beyond these the score is clamped
+_MAX_WATCHES, _MIN_SCORE = SCORE_CURVE[0]
+_MIN_WATCHES, _MAX_SCORE = SCORE_CURVE[-1]
 
 
 def calculate_obscurity_from_watches(watches: int) -> float:
@@ -58,29 +80,42 @@ def calculate_obscurity_from_watches(watches: int) -> float:
         return 100.0
     
     # Handle edge cases
-    if watches >= SCORE_CURVE[0][0]:
-        return SCORE_CURVE[0][1]
-    if watches <= SCORE_CURVE[-1][0]:
-        return SCORE_CURVE[-1][1]
+    if watches >= _MAX_WATCHES:
+        return _MIN_SCORE
+    if watches <= _MIN_WATCHES:
+        return _MAX_SCORE
     
     # Find the two control points to interpolate between
-    for i in range(len(SCORE_CURVE) - 1):
-        upper_watches, upper_score = SCORE_CURVE[i]
-        lower_watches, lower_score = SCORE_CURVE[i + 1]
-        
-        if lower_watches <= watches <= upper_watches:
-            # Linear interpolation
-            ratio = (upper_watches - watches) / (upper_watches - lower_watches)
-            score = upper_score + ratio * (lower_score - upper_score)
-            return score
+    _, upper_watches, span, upper_score, score_drop = _SEGMENTS[bisect_right(_CURVE_WATCHES, watches)]
     
-    return 50.0
+    # Linear interpolation
+    ratio = (upper_watches - watches) / span
+    return upper_score + ratio * score_drop
 
 
 def get_film_obscurity(film: dict) -> tuple[float, str]:
     """Get obscurity score for a single film based on Letterboxd watch counts."""
-    lb_watches = film.get('letterboxd_watches')
-    
+    return _obscurity_for_watches(film.get('letterboxd_watches'))
+
+
+def score_many(watches_list: list[int | None]) -> list[float]:
+    """
+    Obscurity scores for a whole list of watch counts, in order.
+    Each distinct count is interpolated once - many films share a count (e.g. the
+    default assigned to films missing from the DB), so most lookups are cache hits.
+    """
+    cache = {}
+    scores = []
+    for watches in watches_list:
+        score = cache.get(watches)
+        if score is None:
+            score = cache[watches] = _obscurity_for_watches(watches)[0]
+        scores.append(score)
+    return scores
+
+
+def _obscurity_for_watches(lb_watches: int | None) -> tuple[float, str]:
+    """Score + data source for a raw watch count (None when the count is unknown)."""
     if lb_watches is not None:
         if lb_watches == 0:
             # 0 watches = 100% obscure
@@ -115,55 +150,64 @@ def calculate_obscurity_stats(films: list[dict], username: str) -> dict:
             "mood_analysis": {},
         }
     
-    obscurity_score, median_watches = calculate_obscurity_score(films)
-    
-    # Genre breakdown
+    # Single pass over the films for every per-film breakdown. Watch counts and
+    # decades are also pulled out as columns so later steps don't re-read the dicts.
     genre_counts = Counter()
-    for film in films:
-        genre_counts.update(film.get('genres', []))
-    top_genres = dict(genre_counts.most_common(10))
-    
-    # Decade breakdown
     decade_counts = Counter()
-    for film in films:
-        year = film.get('year')
-        if year:
-            decade_counts[f"{(year // 10) * 10}s"] += 1
-    decade_breakdown = dict(sorted(decade_counts.items()))
-    
-    # Country breakdown
     country_counts = Counter()
-    for film in films:
-        country_counts.update(film.get('production_countries', []))
-    country_breakdown = dict(country_counts.most_common(10))
-    
-    # Director breakdown
     director_counts = Counter()
+    rating_counts = Counter()
+    ratings = []
+    watches = []
+    decades = []
+    non_anglophone = 0
+    classic_films = 0
     for film in films:
+        genre_counts.update(film.get('genres', []))
+        
+        year = film.get('year')
+        if year:
+            decade = _DECADE_STR.get(year) or f"{(year // 10) * 10}s"
+            decade_counts[decade] += 1
+            if year < 1980:
+                classic_films += 1
+        else:
+            decade = None
+        decades.append(decade)
+        
+        countries = film.get('production_countries', [])
+        country_counts.update(countries)
+        if countries and _ANGLO.isdisjoint(countries):
+            non_anglophone += 1
+        
         director = film.get('director')
         if director:
             director_counts[director] += 1
-    top_directors = dict(director_counts.most_common(10))
-    
-    # Rating distribution
-    rating_counts = Counter()
-    ratings = []
-    for film in films:
+        
         user_rating = film.get('user_rating')
         if user_rating is not None:
             ratings.append(user_rating)
             rating_counts[str(user_rating)] += 1
+        
+        watches.append(film.get('letterboxd_watches'))
     
+    bonus = _diversity_bonus(non_anglophone, classic_films, len(films))
+    obscurity_score, median_watches = calculate_obscurity_score(films, bonus, watches)
+    
+    top_genres = dict(genre_counts.most_common(10))
+    decade_breakdown = dict(sorted(decade_counts.items()))
+    country_breakdown = dict(country_counts.most_common(10))
+    top_directors = dict(director_counts.most_common(10))
     average_rating = sum(ratings) / len(ratings) if ratings else None
     
-    # Sort films by their individual obscurity score
-    films_with_scores = []
-    for f in films:
-        score, source = get_film_obscurity(f)
-        films_with_scores.append((f, score, source))
+    # Individual obscurity scores, paired back to their films
+    films_with_scores = list(zip(films, score_many(watches)))
     
-    # Sort by obscurity score (highest = most obscure)
-    films_with_scores.sort(key=lambda x: x[1], reverse=True)
+    # Top/bottom 5 by obscurity score (highest = most obscure) without a full sort.
+    # nsmallest runs over the reversed list so ties keep the order a stable
+    # descending sort would have given them.
+    top_obscure = nlargest(5, films_with_scores, key=lambda x: x[1])
+    top_mainstream = nsmallest(5, reversed(films_with_scores), key=lambda x: x[1])
     
     most_obscure = [
         {
@@ -173,7 +217,7 @@ def calculate_obscurity_stats(films: list[dict], username: str) -> dict:
             "director": f.get('director'),
             "poster_path": f.get('poster_path'),
         }
-        for f, score, source in films_with_scores[:5]
+        for f, score in top_obscure
     ]
     
     most_mainstream = [
@@ -184,38 +228,33 @@ def calculate_obscurity_stats(films: list[dict], username: str) -> dict:
             "director": f.get('director'),
             "poster_path": f.get('poster_path'),
         }
-        for f, score, source in films_with_scores[-5:][::-1]
+        for f, score in top_mainstream
     ]
     
     mood_analysis = calculate_mood_analysis(films)
     
-    # Films by decade - top 5 MOST OBSCURE per decade (lowest watches = most obscure)
-    films_by_decade = {}
-    for film in films:
-        year = film.get('year')
-        if year:
-            decade = f"{(year // 10) * 10}s"
-            if decade not in films_by_decade:
-                films_by_decade[decade] = []
-            
-            # Calculate obscurity score for ranking
-            score, _ = get_film_obscurity(film)
-            films_by_decade[decade].append({
+    # Films by decade - top 5 MOST OBSCURE per decade (lowest watches = most obscure),
+    # ranked by the scores already computed above
+    scored_by_decade = {}
+    for (film, score), decade in zip(films_with_scores, decades):
+        if decade:
+            scored_by_decade.setdefault(decade, []).append((film, round(score, 1)))
+    
+    # Only the 5 highest obscurity scores per decade are turned into response dicts
+    films_by_decade = {
+        decade: [
+            {
                 "title": film.get('title'),
                 "year": film.get('year'),
                 "watches": film.get('letterboxd_watches'),
                 "director": film.get('director'),
                 "poster_path": film.get('poster_path'),
-                "obscurity_score": round(score, 1),
-            })
-    
-    # Sort each decade by obscurity score (highest = most obscure) and limit to 5
-    for decade in films_by_decade:
-        films_by_decade[decade] = sorted(
-            films_by_decade[decade],
-            key=lambda x: x.get('obscurity_score', 0),
-            reverse=True
-        )[:5]
+                "obscurity_score": score,
+            }
+            for film, score in nlargest(5, scored, key=lambda x: x[1])
+        ]
+        for decade, scored in scored_by_decade.items()
+    }
     
     return {
         "username": username,
@@ -235,89 +274,115 @@ def calculate_obscurity_stats(films: list[dict], username: str) -> dict:
     }
 
 
-def calculate_obscurity_score(films: list[dict]) -> tuple[float, int]:
+def calculate_obscurity_score(
+    films: list[dict],
+    bonus: float | None = None,
+    watches: list[int | None] | None = None,
+) -> tuple[float, int]:
     """
     Calculate overall obscurity score using MEDIAN watch count.
+    Pass `bonus` and the `watches` column (one count per film) when they were
+    already collected alongside other stats.
     """
     if not films:
         return 50, 0
     
+    if bonus is None:
+        # Small diversity bonus (max +3) for international/classic films
+        bonus = calculate_diversity_bonus(films)
+    
+    if watches is None:
+        watches = [f.get('letterboxd_watches') for f in films]
+    
     # Get all Letterboxd watch counts
-    lb_watches = [f.get('letterboxd_watches') for f in films if f.get('letterboxd_watches')]
+    lb_watches = [w for w in watches if w]
     
     if lb_watches and len(lb_watches) >= 3:
-        # Calculate median
-        lb_watches.sort()
-        n = len(lb_watches)
-        if n % 2 == 0:
-            median_watches = (lb_watches[n//2 - 1] + lb_watches[n//2]) // 2
-        else:
-            median_watches = lb_watches[n//2]
+        # Calculate median (floored to a whole watch count for even-length lists)
+        median_watches = math.floor(median(lb_watches))
         
         # Calculate score from median
         base_score = calculate_obscurity_from_watches(median_watches)
         
-        # Small diversity bonus (max +3) for international/classic films
-        bonus = calculate_diversity_bonus(films)
-        
         final_score = max(0, min(100, base_score + bonus))
         return final_score, median_watches
     
     # Fallback: use individual film scores
-    film_scores = [get_film_obscurity(f)[0] for f in films]
+    film_scores = score_many(watches)
     if film_scores:
-        film_scores.sort()
-        median_score = film_scores[len(film_scores)//2]
-        bonus = calculate_diversity_bonus(films)
+        median_score = median_high(film_scores)
         return max(0, min(100, median_score + bonus)), 0
     
     return 50, 0
 
 
+_ANGLO = frozenset({'United States of America', 'USA', 'United Kingdom', 'UK'})
+
+
 def calculate_diversity_bonus(films: list[dict]) -> float:
     """Small bonus for diverse taste. Max +3 points."""
     if not films:
         return 0
     
-    bonus = 0
-    n = len(films)
+    non_anglophone = 0
+    classic_films = 0
+    for f in films:
+        countries = f.get('production_countries')
+        if countries and _ANGLO.isdisjoint(countries):
+            non_anglophone += 1
+        year = f.get('year')
+        if year and year < 1980:
+            classic_films += 1
+    
+    return _diversity_bonus(non_anglophone, classic_films, len(films))
+
+
+def _diversity_bonus(non_anglophone: int, classic_films: int, n: int) -> float:
+    """Diversity bonus from pre-counted non-US/UK and pre-1980 films out of n."""
+    if n <= 0:
+        return 0
     
     # Non-US/UK films (max +1.5)
-    non_anglophone = sum(
-        1 for f in films 
-        if f.get('production_countries') and 
-        not any(c in f.get('production_countries', []) 
-                for c in ['United States of America', 'USA', 'United Kingdom', 'UK'])
-    )
-    bonus += min(1.5, (non_anglophone / n) * 3) if n > 0 else 0
+    bonus = min(1.5, (non_anglophone / n) * 3)
     
     # Pre-1980 films (max +1.5)
-    classic_films = sum(1 for f in films if f.get('year') and f.get('year') < 1980)
-    bonus += min(1.5, (classic_films / n) * 3) if n > 0 else 0
+    bonus += min(1.5, (classic_films / n) * 3)
     
     return min(3, bonus)
 
 
+MOOD_MAPPING = {
+    "Dark & Intense": ["Horror", "Thriller", "Crime", "War", "Mystery"],
+    "Fun & Light": ["Comedy", "Animation", "Family", "Music"],
+    "Emotional & Deep": ["Drama", "Romance", "History"],
+    "Adventurous": ["Action", "Adventure", "Science Fiction", "Fantasy", "Western"],
+    "Thought-Provoking": ["Documentary", "Mystery", "Science Fiction"]
+}
+
+
+def _genre_to_moods(mapping: dict[str, list[str]]) -> dict[str, list[str]]:
+    """Reverse index: genre -> every mood it counts towards (e.g. Mystery -> 2 moods)."""
+    index = {}
+    for mood, genres in mapping.items():
+        for genre in genres:
+            index.setdefault(genre, []).append(mood)
+    return index
+
+
+_GENRE_TO_MOODS = _genre_to_moods(MOOD_MAPPING)
+
+
 def calculate_mood_analysis(films: list[dict]) -> dict[str, float]:
     """Analyze mood based on genres."""
-    mood_mapping = {
-        "Dark & Intense": ["Horror", "Thriller", "Crime", "War", "Mystery"],
-        "Fun & Light": ["Comedy", "Animation", "Family", "Music"],
-        "Emotional & Deep": ["Drama", "Romance", "History"],
-        "Adventurous": ["Action", "Adventure", "Science Fiction", "Fantasy", "Western"],
-        "Thought-Provoking": ["Documentary", "Mystery", "Science Fiction"]
-    }
-    
-    mood_counts = {mood: 0 for mood in mood_mapping}
+    mood_counts = {mood: 0 for mood in MOOD_MAPPING}
     total = 0
     
     for film in films:
         for genre in film.get('genres', []):
-            for mood, genres in mood_mapping.items():
-                if genre in genres:
-                    mood_counts[mood] += 1
-                    total += 1
+            for mood in _GENRE_TO_MOODS.get(genre, ()):
+                mood_counts[mood] += 1
+                total += 1
     
     if total > 0:
         return {mood: round((count / total) * 100, 1) for mood, count in mood_counts.items()}
-    return {mood: 0 for mood in mood_mapping}
+    return {mood: 0 for mood in MOOD_MAPPING}
@@ -5,35 +5,235 @@ Uses SQLite for simplicity (can be upgraded to PostgreSQL for production).
 
 import sqlite3
 import json
-from typing import Optional, List, Dict
+from collections import OrderedDict
+from typing import Optional, List, Dict, Iterator
 from contextlib import contextmanager
+from functools import lru_cache
+import atexit
 import os
+import queue
+import time
+import threading
 from pathlib import Path
 
+# orjson parses/serializes the genres/countries JSON columns several times faster than
+# the stdlib; its JSONDecodeError subclasses json.JSONDecodeError, so handlers are shared.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    json_loads = orjson.loads
+
+    def json_dumps(value) -> str:
+        return orjson.dumps(value).decode()
+except ImportError:
+    ORJSON_AVAILABLE = False
+    json_loads = json.loads
+
+    def json_dumps(value) -> str:
+        # Same compact, UTF-8 text orjson writes, so rows are identical either way
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+@lru_cache(maxsize=4096)
+def _dump_list(items: tuple) -> str:
+    return json_dumps(list(items))
+
+
+def _json_list(value) -> str:
+    """JSON text for a genres/countries list; the vocabulary is tiny, so most lists repeat."""
+    if isinstance(value, (list, tuple)):
+        try:
+            return _dump_list(tuple(value))
+        except TypeError:  # unhashable items; serialize directly
+            pass
+    return json_dumps(value)
+
+
 # Database file path
 # Defaults to backend/films_complete.db, but can be overridden with DB_PATH env variable
 _default_db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "films_complete.db")
 DB_PATH = os.getenv("DB_PATH", _default_db_path)
 
 
+# Per-connection tuning. Defaults (rollback journal, synchronous=FULL, 2MB cache) make
+# every commit pay several fsyncs; these keep bulk writes cheap and reads off disk.
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",  # 64MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256MB
+)
+
+# journal_mode=WAL is persisted in the database file, so it only needs setting once per path.
+_wal_enabled_paths = set()
+
+# Stored in PRAGMA user_version once init_database has brought a file up to date.
+# Bump it whenever init_database gains a new column, index or migration.
+SCHEMA_VERSION = 3
+
+# Columns the /films listing projects; idx_films_watches_cover holds all of them.
+_LIST_COLUMNS = frozenset((
+    'letterboxd_watches', 'title', 'year', 'letterboxd_slug', 'director', 'genres', 'production_countries',
+))
+
+# Column names of the films table per database path, read once instead of on every save.
+# init_database() refreshes the entry after any schema migration.
+_film_columns: Dict[str, frozenset] = {}
+_film_columns_lock = threading.Lock()
+
+
 def get_db_path() -> str:
     """Get the database file path."""
     return DB_PATH
 
 
+def _configure_connection(conn: sqlite3.Connection, db_path: str) -> None:
+    """Apply WAL mode (once per database file) and the per-connection pragmas."""
+    if db_path not in _wal_enabled_paths:
+        enable_wal(conn)
+        _wal_enabled_paths.add(db_path)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+
+
+class _ConnectionPool:
+    """
+    Keeps up to `size` idle connections to one database file for reuse.
+
+    Opening a connection (and replaying the pragmas) on every query cost more than
+    the short lookups themselves, and a fresh connection starts with a cold page
+    cache. Callers never wait on the pool: if every pooled connection is checked
+    out, a new one is opened, and surplus connections are closed on return.
+    """
+
+    def __init__(self, db_path: str, size: int = 8):
+        self.db_path = db_path
+        self._idle = queue.Queue(maxsize=size)
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False: a connection may be handed to a different thread
+        # next time (FastAPI threadpool); the pool guarantees one user at a time.
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=5.0,  # doubles as busy_timeout
+            check_same_thread=False,
+            # Room for every fixed query plus the per-shape UPSERTs and slug IN buckets
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        _configure_connection(conn, self.db_path)
+        return conn
+
+    def get(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def put(self, conn: sqlite3.Connection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            _close_connection(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                _close_connection(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def _close_connection(conn: sqlite3.Connection) -> None:
+    # PRAGMA optimize refreshes planner statistics for whatever this connection's
+    # queries would have benefited from (usually a no-op; a full ANALYZE is ~20ms here).
+    # No analysis_limit: sampled row estimates made the planner answer get_stats'
+    # counts from the wide /films covering index instead of idx_letterboxd_watches.
+    try:
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error:
+        pass  # e.g. read-only or locked - statistics can wait for the next close
+    conn.close()
+
+
+# One pool per database file, so tests/scripts that repoint DB_PATH get their own
+_pools: Dict[str, _ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool() -> _ConnectionPool:
+    pool = _pools.get(DB_PATH)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(DB_PATH, _ConnectionPool(DB_PATH))
+    return pool
+
+
+def close_db_connections() -> None:
+    """Close every idle pooled connection (e.g. before replacing or deleting the DB file)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_db_connections)
+
+
+def enable_wal(conn: sqlite3.Connection) -> bool:
+    """
+    Switch the database file to WAL journaling (persisted in the file itself).
+
+    WAL needs shared memory between processes, so it only works when the DB lives on a
+    local filesystem; on e.g. NFS SQLite keeps the old journal mode, which still works,
+    just with writers blocking readers.
+    """
+    mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    if str(mode).lower() != 'wal':
+        print(f"⚠️  SQLite kept journal_mode={mode} (WAL unavailable - is the DB on a network filesystem?)")
+        return False
+    return True
+
+
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # Enable column access by name
+    """Context manager for (pooled) database connections."""
+    pool = _get_pool()
+    conn = pool.get()
     try:
         yield conn
         conn.commit()
-    except Exception:
+    except BaseException:
         conn.rollback()
         raise
     finally:
-        conn.close()
+        pool.put(conn)
+
+
+@contextmanager
+def bulk_load_connection():
+    """
+    Pooled connection tuned for a long offline write job (populate/refresh).
+
+    Commits skip fsync entirely (synchronous=OFF) and the page cache is larger; the
+    connection's normal pragmas are restored before it goes back to the pool. WAL stays
+    on - leaving it needs exclusive access, and a crash with journal_mode=OFF can
+    corrupt the file rather than just lose the last commits.
+    """
+    with get_db_connection() as conn:
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA cache_size=-200000")  # ~200MB
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            # synchronous can't change mid-transaction, hence the commit/rollback first
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
 
 
 def init_database():
@@ -41,6 +241,18 @@ def init_database():
     with get_db_connection() as conn:
         cursor = conn.cursor()
         
+        # WAL + synchronous=NORMAL: readers never block on the writer and commits skip
+        # most fsyncs. Set explicitly here in case the file was replaced since this
+        # process first connected (e.g. a freshly downloaded DB).
+        enable_wal(conn)
+        
+        # Table, columns and indexes are already current - skip the introspection below
+        cursor.execute("PRAGMA user_version")
+        if cursor.fetchone()[0] >= SCHEMA_VERSION:
+            # Refresh stale planner statistics (0x10000 = check every table; SQLite 3.46+)
+            cursor.execute("PRAGMA optimize=0x10002")
+            return
+        
         # Check if films table exists and get its schema
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='films'")
         table_exists = cursor.fetchone() is not None
@@ -132,277 +344,621 @@ def init_database():
                         pass
         
         # Create indexes for common queries (only if column exists)
-        cursor.execute("PRAGMA table_info(films)")
-        columns = [row[1] for row in cursor.fetchall()]
+        _film_columns.pop(DB_PATH, None)  # columns may have just been added
+        columns = _get_film_columns(cursor)
         
         if 'letterboxd_slug' in columns:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_letterboxd_slug ON films(letterboxd_slug)")
+            if _has_unique_slug_index(cursor):
+                # The UNIQUE constraint already indexes slugs; a second plain index only slows writes.
+                cursor.execute("DROP INDEX IF EXISTS idx_letterboxd_slug")
+            else:
+                # Tables migrated via ALTER TABLE have no UNIQUE constraint on the slug.
+                try:
+                    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_films_slug ON films(letterboxd_slug)")
+                except sqlite3.IntegrityError:
+                    # Duplicate slugs in a legacy table - fall back to a plain index.
+                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_letterboxd_slug ON films(letterboxd_slug)")
         if 'tmdb_id' in columns:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_tmdb_id ON films(tmdb_id)")
         if 'title' in columns and 'year' in columns:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_title_year ON films(title, year)")
         if 'letterboxd_watches' in columns:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_letterboxd_watches ON films(letterboxd_watches)")
+        if _LIST_COLUMNS <= columns:
+            # Covers the /films listing (ORDER BY watches DESC, slug DESC) so pages, including
+            # keyset pages, come straight from the index. Replaces idx_watches_covering,
+            # whose column order couldn't serve the slug tie-break.
+            cursor.execute("DROP INDEX IF EXISTS idx_watches_covering")
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_films_watches_cover ON films("
+                "letterboxd_watches DESC, letterboxd_slug DESC, title, year, director, genres, production_countries)"
+            )
         if 'year' in columns:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_year ON films(year)")
         
+        # Indexes may have just been created: gather statistics for them now rather than
+        # waiting for PRAGMA optimize to notice
+        cursor.execute("ANALYZE")
+        
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         conn.commit()
 
 
-def film_to_dict(row: sqlite3.Row) -> Dict:
-    """Convert a database row to a film dictionary."""
+def _get_film_columns(cursor: sqlite3.Cursor) -> frozenset:
+    """Column names of the films table, cached per database path."""
+    columns = _film_columns.get(DB_PATH)
+    if columns is None:
+        with _film_columns_lock:
+            cursor.execute("PRAGMA table_info(films)")
+            columns = frozenset(row[1] for row in cursor.fetchall())
+            if columns:  # don't remember a table that hasn't been created yet
+                _film_columns[DB_PATH] = columns
+    return columns
+
+
+def _has_unique_slug_index(cursor: sqlite3.Cursor) -> bool:
+    """True if a (non-partial) unique index covers exactly films.letterboxd_slug."""
+    cursor.execute("PRAGMA index_list(films)")
+    for _seq, name, unique, _origin, partial in cursor.fetchall():
+        if not unique or partial:
+            continue
+        cursor.execute(f'PRAGMA index_info("{name}")')
+        if [row[2] for row in cursor.fetchall()] == ['letterboxd_slug']:
+            return True
+    return False
+
+
+# Columns read back into film dicts, in the order film_to_dict unpacks them
+FILM_COLUMNS = (
+    'letterboxd_slug', 'letterboxd_id', 'title', 'year',
+    'letterboxd_watches', 'letterboxd_likes', 'letterboxd_lists', 'letterboxd_rating',
+    'tmdb_id', 'popularity', 'vote_count', 'vote_average', 'poster_path',
+    'original_language', 'runtime', 'budget', 'revenue',
+    'director', 'genres', 'production_countries',
+)
+_SELECT_FILMS = f"SELECT {', '.join(FILM_COLUMNS)} FROM films"
+
+
+def film_to_dict(row: tuple) -> Dict:
+    """Convert a database row (selected as FILM_COLUMNS; tuple or sqlite3.Row) to a film dictionary."""
+    (slug, letterboxd_id, title, year,
+     watches, likes, lists, rating,
+     tmdb_id, popularity, vote_count, vote_average, poster_path,
+     original_language, runtime, budget, revenue,
+     director, genres, countries) = row
+    
     film = {
-        'title': row['title'],
-        'year': row['year'],
-        'slug': row['letterboxd_slug'],
-        'letterboxd_id': row['letterboxd_id'],
-        'letterboxd_url': f"https://letterboxd.com/film/{row['letterboxd_slug']}/" if row['letterboxd_slug'] else None,
+        'title': title,
+        'year': year,
+        'slug': slug,
+        'letterboxd_id': letterboxd_id,
+        'letterboxd_url': f"https://letterboxd.com/film/{slug}/" if slug else None,
     }
     
     # Letterboxd data
-    if row['letterboxd_watches'] is not None:
-        film['letterboxd_watches'] = row['letterboxd_watches']
-    if row['letterboxd_likes'] is not None:
-        film['letterboxd_likes'] = row['letterboxd_likes']
-    if row['letterboxd_lists'] is not None:
-        film['letterboxd_lists'] = row['letterboxd_lists']
-    if row['letterboxd_rating'] is not None:
-        film['letterboxd_rating'] = row['letterboxd_rating']
+    if watches is not None:
+        film['letterboxd_watches'] = watches
+    if likes is not None:
+        film['letterboxd_likes'] = likes
+    if lists is not None:
+        film['letterboxd_lists'] = lists
+    if rating is not None:
+        film['letterboxd_rating'] = rating
     
     # TMDb data
-    if row['tmdb_id'] is not None:
-        film['tmdb_id'] = row['tmdb_id']
-    if row['popularity'] is not None:
-        film['popularity'] = row['popularity']
-    if row['vote_count'] is not None:
-        film['vote_count'] = row['vote_count']
-    if row['vote_average'] is not None:
-        film['vote_average'] = row['vote_average']
-    if row['poster_path']:
-        film['poster_path'] = row['poster_path']
-    if row['original_language']:
-        film['original_language'] = row['original_language']
-    if row['runtime'] is not None:
-        film['runtime'] = row['runtime']
-    if row['budget'] is not None:
-        film['budget'] = row['budget']
-    if row['revenue'] is not None:
-        film['revenue'] = row['revenue']
+    if tmdb_id is not None:
+        film['tmdb_id'] = tmdb_id
+    if popularity is not None:
+        film['popularity'] = popularity
+    if vote_count is not None:
+        film['vote_count'] = vote_count
+    if vote_average is not None:
+        film['vote_average'] = vote_average
+    if poster_path:
+        film['poster_path'] = poster_path
+    if original_language:
+        film['original_language'] = original_language
+    if runtime is not None:
+        film['runtime'] = runtime
+    if budget is not None:
+        film['budget'] = budget
+    if revenue is not None:
+        film['revenue'] = revenue
     
     # Metadata
-    if row['director']:
-        film['director'] = row['director']
-    if row['genres']:
+    if director:
+        film['director'] = director
+    
+    film['genres'] = []
+    if genres:
         try:
-            film['genres'] = json.loads(row['genres'])
+            film['genres'] = json_loads(genres)
         except json.JSONDecodeError:
-            film['genres'] = []
-    else:
-        film['genres'] = []
+            pass
     
-    if row['production_countries']:
+    film['production_countries'] = []
+    if countries:
         try:
-            film['production_countries'] = json.loads(row['production_countries'])
+            film['production_countries'] = json_loads(countries)
         except json.JSONDecodeError:
-            film['production_countries'] = []
-    else:
-        film['production_countries'] = []
+            pass
     
     return film
 
 
+# In-process LRU of slug -> film dict. Popular films recur across users, so most lookups
+# skip SQLite and film_to_dict entirely. Entries are keyed by DB_PATH too, and saves drop
+# the slugs they touch. Misses aren't cached: refresh_db/populate_local add films from
+# another process, and a cached "not in the DB" would hide them until a restart.
+FILM_CACHE_SIZE = int(os.getenv("FILM_CACHE_SIZE", "8192"))
+_film_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+_film_cache_lock = threading.Lock()
+# Bumped on every invalidation; a lookup only fills the cache if no save happened while
+# it was reading, so a racing reader can't re-cache a row that was just overwritten.
+_film_cache_generation = 0
+_NOT_CACHED = object()
+
+
+def _copy_film(film: Optional[Dict]) -> Optional[Dict]:
+    """Copy of a cached film so callers can't mutate the cached entry (incl. its lists)."""
+    if film is None:
+        return None
+    film = dict(film)
+    film['genres'] = list(film['genres'])
+    film['production_countries'] = list(film['production_countries'])
+    return film
+
+
+def _film_cache_get(slug: str):
+    key = (DB_PATH, slug)
+    with _film_cache_lock:
+        film = _film_cache.get(key, _NOT_CACHED)
+        if film is not _NOT_CACHED:
+            _film_cache.move_to_end(key)
+    return film
+
+
+def _film_cache_put(found: Dict[str, Dict], generation: int) -> None:
+    """Cache films just read from the DB."""
+    with _film_cache_lock:
+        if generation != _film_cache_generation:
+            return
+        for slug, film in found.items():
+            key = (DB_PATH, slug)
+            _film_cache[key] = film
+            _film_cache.move_to_end(key)
+        while len(_film_cache) > FILM_CACHE_SIZE:
+            _film_cache.popitem(last=False)
+
+
+def invalidate_film_cache(slugs: Optional[List[str]] = None) -> None:
+    """Drop the given slugs (or everything) from the film cache after writes."""
+    global _film_cache_generation
+    with _film_cache_lock:
+        _film_cache_generation += 1
+        _stats_cache.clear()
+        if slugs is None:
+            _film_cache.clear()
+        else:
+            for slug in slugs:
+                _film_cache.pop((DB_PATH, slug), None)
+
+
 def get_film_by_slug(slug: str) -> Optional[Dict]:
     """Get a film by its Letterboxd slug."""
+    film = _film_cache_get(slug)
+    if film is not _NOT_CACHED:
+        return _copy_film(film)
+    
+    generation = _film_cache_generation
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM films WHERE letterboxd_slug = ?", (slug,))
+        cursor.row_factory = None  # plain tuples unpack faster than sqlite3.Row
+        cursor.execute(f"{_SELECT_FILMS} WHERE letterboxd_slug = ?", (slug,))
         row = cursor.fetchone()
-        if row:
-            return film_to_dict(row)
-    return None
+        film = film_to_dict(row) if row else None
+    if film is not None:
+        _film_cache_put({slug: film}, generation)
+    return _copy_film(film)
 
 
 def get_films_by_slugs(slugs: List[str]) -> Dict[str, Dict]:
     """Get multiple films by their Letterboxd slugs. Returns a dict mapping slug to film."""
+    result = {}
     if not slugs:
-        return {}
+        return result
     
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            placeholders = ','.join('?' * len(slugs))
-            cursor.execute(f"SELECT * FROM films WHERE letterboxd_slug IN ({placeholders})", slugs)
-            rows = cursor.fetchall()
-            result = {row['letterboxd_slug']: film_to_dict(row) for row in rows}
-            
-            # Debug: show sample of what we found
-            if result:
-                sample_slug = list(result.keys())[0]
-                print(f"   ✅ Sample match: '{sample_slug}' -> {result[sample_slug].get('title', 'N/A')}")
-            elif slugs:
-                # Show sample of what we're looking for
-                print(f"   ⚠️  No matches found. Sample slugs searched: {slugs[:3]}")
-                # Check if database has any films at all
-                cursor.execute("SELECT COUNT(*) as total FROM films")
-                total = cursor.fetchone()['total']
-                print(f"   📊 Database has {total} total films")
-                if total > 0:
-                    # Show sample slugs from database
-                    cursor.execute("SELECT letterboxd_slug FROM films LIMIT 3")
-                    sample_db_slugs = [row['letterboxd_slug'] for row in cursor.fetchall()]
-                    print(f"   📋 Sample slugs in DB: {sample_db_slugs}")
-            
-            return result
+        for slug, film in iter_films_by_slugs(slugs):
+            result[slug] = film
     except Exception as e:
         print(f"   ❌ Error querying database: {e}")
-        return {}
+    
+    return result
+
+
+def iter_films_by_slugs(slugs: List[str], batch_size: int = 1000) -> Iterator[tuple]:
+    """Yield (slug, film) for the given slugs that are in the database.
+    
+    Cached films come first; the rest are converted one fetchmany() batch at a time,
+    so a caller that stops early doesn't pay to build every film dict.
+    """
+    # Serve what we can from the cache; only the misses go to SQLite
+    misses = []
+    for slug in slugs:
+        film = _film_cache_get(slug)
+        if film is _NOT_CACHED:
+            misses.append(slug)
+        else:
+            yield slug, _copy_film(film)
+    if not misses:
+        return
+    
+    generation = _film_cache_generation
+    found = {}
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None  # plain tuples unpack faster than sqlite3.Row
+            for row in _select_films_by_slugs(cursor, misses, batch_size):
+                film = found[row[0]] = film_to_dict(row)
+                yield row[0], _copy_film(film)
+    finally:
+        _film_cache_put(found, generation)
+
+
+# Above this many slugs, look them up through a temp table instead of one giant IN (...):
+# the statement stays small and cacheable and SQLITE_MAX_VARIABLE_NUMBER never applies.
+SLUG_IN_LIMIT = 512
+
+
+@lru_cache(maxsize=None)
+def _slug_in_sql(size: int) -> str:
+    return f"{_SELECT_FILMS} WHERE letterboxd_slug IN ({','.join('?' * size)})"
+
+
+def _select_films_by_slugs(cursor: sqlite3.Cursor, slugs: List[str], batch_size: int = 1000) -> Iterator[tuple]:
+    """FILM_COLUMNS rows for the given slugs (in no particular order)."""
+    if len(slugs) <= SLUG_IN_LIMIT:
+        # Pad to the next power of two with NULLs (which match nothing) so every list
+        # size maps onto one of ~10 statements that stay in the statement cache.
+        size = 1 << (len(slugs) - 1).bit_length()
+        cursor.execute(_slug_in_sql(size), [*slugs, *([None] * (size - len(slugs)))])
+        yield from _fetch_batches(cursor, batch_size)
+        return
+    
+    # Temp tables live per connection, so pooled connections keep reusing theirs
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_slugs (slug TEXT PRIMARY KEY)")
+    try:
+        cursor.executemany("INSERT OR IGNORE INTO lookup_slugs (slug) VALUES (?)", ((s,) for s in slugs))
+        cursor.execute(
+            f"{_SELECT_FILMS} WHERE letterboxd_slug IN (SELECT slug FROM temp.lookup_slugs)"
+        )
+        yield from _fetch_batches(cursor, batch_size)
+    finally:
+        cursor.execute("DELETE FROM temp.lookup_slugs")
+
+
+def _fetch_batches(cursor: sqlite3.Cursor, batch_size: int) -> Iterator[tuple]:
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield from batch
 
 
 def save_film(film: Dict) -> None:
-    """Save or update a film in the database."""
+    """Save or update a film in the database (one UPSERT, no existence check)."""
+    save_films([film])
+
+
+def _save_film(cursor: sqlite3.Cursor, film: Dict) -> None:
+    """
+    Save or update a film using an existing cursor (caller owns the transaction).
+
+    SELECT + UPDATE/INSERT; only used by _save_films for legacy tables that have no
+    UNIQUE slug index for ON CONFLICT to match.
+    """
     slug = film.get('slug') or film.get('letterboxd_slug')
     if not slug:
         return  # Can't save without a slug
     
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
+    # Prepare data
+    genres_json = _json_list(film.get('genres', []))
+    countries_json = _json_list(film.get('production_countries', []))
+    
+    # Check if film exists
+    cursor.execute("SELECT id FROM films WHERE letterboxd_slug = ?", (slug,))
+    exists = cursor.fetchone()
+    
+    if exists:
+        # Update existing film - only update fields that are provided (not None)
+        update_fields = []
+        update_values = []
         
-        # Prepare data
-        genres_json = json.dumps(film.get('genres', []))
-        countries_json = json.dumps(film.get('production_countries', []))
+        if 'letterboxd_id' in film:
+            update_fields.append('letterboxd_id = ?')
+            update_values.append(film.get('letterboxd_id'))
+        if 'title' in film and film.get('title'):
+            update_fields.append('title = ?')
+            update_values.append(film.get('title'))
+        if 'year' in film and film.get('year') is not None:
+            update_fields.append('year = ?')
+            update_values.append(film.get('year'))
+        if 'tmdb_id' in film:
+            update_fields.append('tmdb_id = ?')
+            update_values.append(film.get('tmdb_id'))
+        if 'letterboxd_watches' in film and film.get('letterboxd_watches') is not None:
+            update_fields.append('letterboxd_watches = ?')
+            update_values.append(film.get('letterboxd_watches'))
+        if 'letterboxd_likes' in film and film.get('letterboxd_likes') is not None:
+            update_fields.append('letterboxd_likes = ?')
+            update_values.append(film.get('letterboxd_likes'))
+        if 'letterboxd_lists' in film and film.get('letterboxd_lists') is not None:
+            update_fields.append('letterboxd_lists = ?')
+            update_values.append(film.get('letterboxd_lists'))
+        if 'letterboxd_rating' in film and film.get('letterboxd_rating') is not None:
+            update_fields.append('letterboxd_rating = ?')
+            update_values.append(film.get('letterboxd_rating'))
+        if 'popularity' in film:
+            update_fields.append('popularity = ?')
+            update_values.append(film.get('popularity'))
+        if 'vote_count' in film:
+            update_fields.append('vote_count = ?')
+            update_values.append(film.get('vote_count'))
+        if 'vote_average' in film:
+            update_fields.append('vote_average = ?')
+            update_values.append(film.get('vote_average'))
+        if 'poster_path' in film:
+            update_fields.append('poster_path = ?')
+            update_values.append(film.get('poster_path'))
+        if 'original_language' in film:
+            update_fields.append('original_language = ?')
+            update_values.append(film.get('original_language'))
+        if 'runtime' in film:
+            update_fields.append('runtime = ?')
+            update_values.append(film.get('runtime'))
+        if 'budget' in film:
+            update_fields.append('budget = ?')
+            update_values.append(film.get('budget'))
+        if 'revenue' in film:
+            update_fields.append('revenue = ?')
+            update_values.append(film.get('revenue'))
+        if 'director' in film and film.get('director'):
+            update_fields.append('director = ?')
+            update_values.append(film.get('director'))
+        if 'genres' in film:
+            update_fields.append('genres = ?')
+            update_values.append(genres_json)
+        if 'production_countries' in film:
+            update_fields.append('production_countries = ?')
+            update_values.append(countries_json)
         
-        # Check if film exists
-        cursor.execute("SELECT id FROM films WHERE letterboxd_slug = ?", (slug,))
-        exists = cursor.fetchone()
+        # Always update the updated_at timestamp (if column exists)
+        if 'updated_at' in _get_film_columns(cursor):
+            update_fields.append('updated_at = CURRENT_TIMESTAMP')
+        update_values.append(slug)
         
-        if exists:
-            # Update existing film - only update fields that are provided (not None)
-            update_fields = []
-            update_values = []
-            
-            if 'letterboxd_id' in film:
-                update_fields.append('letterboxd_id = ?')
-                update_values.append(film.get('letterboxd_id'))
-            if 'title' in film and film.get('title'):
-                update_fields.append('title = ?')
-                update_values.append(film.get('title'))
-            if 'year' in film and film.get('year') is not None:
-                update_fields.append('year = ?')
-                update_values.append(film.get('year'))
-            if 'tmdb_id' in film:
-                update_fields.append('tmdb_id = ?')
-                update_values.append(film.get('tmdb_id'))
-            if 'letterboxd_watches' in film and film.get('letterboxd_watches') is not None:
-                update_fields.append('letterboxd_watches = ?')
-                update_values.append(film.get('letterboxd_watches'))
-            if 'letterboxd_likes' in film and film.get('letterboxd_likes') is not None:
-                update_fields.append('letterboxd_likes = ?')
-                update_values.append(film.get('letterboxd_likes'))
-            if 'letterboxd_lists' in film and film.get('letterboxd_lists') is not None:
-                update_fields.append('letterboxd_lists = ?')
-                update_values.append(film.get('letterboxd_lists'))
-            if 'letterboxd_rating' in film and film.get('letterboxd_rating') is not None:
-                update_fields.append('letterboxd_rating = ?')
-                update_values.append(film.get('letterboxd_rating'))
-            if 'popularity' in film:
-                update_fields.append('popularity = ?')
-                update_values.append(film.get('popularity'))
-            if 'vote_count' in film:
-                update_fields.append('vote_count = ?')
-                update_values.append(film.get('vote_count'))
-            if 'vote_average' in film:
-                update_fields.append('vote_average = ?')
-                update_values.append(film.get('vote_average'))
-            if 'poster_path' in film:
-                update_fields.append('poster_path = ?')
-                update_values.append(film.get('poster_path'))
-            if 'original_language' in film:
-                update_fields.append('original_language = ?')
-                update_values.append(film.get('original_language'))
-            if 'runtime' in film:
-                update_fields.append('runtime = ?')
-                update_values.append(film.get('runtime'))
-            if 'budget' in film:
-                update_fields.append('budget = ?')
-                update_values.append(film.get('budget'))
-            if 'revenue' in film:
-                update_fields.append('revenue = ?')
-                update_values.append(film.get('revenue'))
-            if 'director' in film and film.get('director'):
-                update_fields.append('director = ?')
-                update_values.append(film.get('director'))
-            if 'genres' in film:
-                update_fields.append('genres = ?')
-                update_values.append(genres_json)
-            if 'production_countries' in film:
-                update_fields.append('production_countries = ?')
-                update_values.append(countries_json)
-            
-            # Always update the updated_at timestamp (if column exists)
-            # Check if column exists before adding it
-            cursor.execute("PRAGMA table_info(films)")
-            columns = [row[1] for row in cursor.fetchall()]
-            if 'updated_at' in columns:
-                update_fields.append('updated_at = CURRENT_TIMESTAMP')
-            update_values.append(slug)
-            
-            if update_fields:
-                update_sql = f"UPDATE films SET {', '.join(update_fields)} WHERE letterboxd_slug = ?"
-                cursor.execute(update_sql, update_values)
+        if update_fields:
+            update_sql = f"UPDATE films SET {', '.join(update_fields)} WHERE letterboxd_slug = ?"
+            cursor.execute(update_sql, update_values)
+    else:
+        # Insert new film - check which columns exist first
+        columns = _get_film_columns(cursor)
+        
+        # Build column list based on what exists
+        insert_cols = []
+        insert_vals = []
+        placeholders = []
+        
+        # Required columns
+        insert_cols.append('letterboxd_slug')
+        insert_vals.append(slug)
+        placeholders.append('?')
+        
+        # Optional columns (only if they exist in schema)
+        optional_fields = [
+            ('letterboxd_id', film.get('letterboxd_id')),
+            ('title', film.get('title')),
+            ('year', film.get('year')),
+            ('tmdb_id', film.get('tmdb_id')),
+            ('letterboxd_watches', film.get('letterboxd_watches')),
+            ('letterboxd_likes', film.get('letterboxd_likes')),
+            ('letterboxd_lists', film.get('letterboxd_lists')),
+            ('letterboxd_rating', film.get('letterboxd_rating')),
+            ('popularity', film.get('popularity')),
+            ('vote_count', film.get('vote_count')),
+            ('vote_average', film.get('vote_average')),
+            ('poster_path', film.get('poster_path')),
+            ('original_language', film.get('original_language')),
+            ('runtime', film.get('runtime')),
+            ('budget', film.get('budget')),
+            ('revenue', film.get('revenue')),
+            ('director', film.get('director')),
+            ('genres', genres_json),
+            ('production_countries', countries_json),
+        ]
+        
+        for col_name, col_value in optional_fields:
+            if col_name in columns:
+                insert_cols.append(col_name)
+                insert_vals.append(col_value)
+                placeholders.append('?')
+        
+        # Insert with dynamic column list
+        if len(insert_cols) > 1:  # At least slug + one other column
+            insert_sql = f"INSERT INTO films ({', '.join(insert_cols)}) VALUES ({', '.join(placeholders)})"
+            cursor.execute(insert_sql, insert_vals)
+
+
+def save_films(films: List[Dict], conn: Optional[sqlite3.Connection] = None) -> None:
+    """
+    Save multiple films to the database in a single transaction.
+
+    One connection and one commit for the whole list - committing per film costs an
+    fsync each, which dominated bulk saves from populate_local/refresh_db.
+    Long-running jobs can pass their own `conn` to reuse one writer connection across
+    batches; the batch is committed on it before returning.
+    """
+    if not films:
+        return
+
+    if conn is not None:
+        _save_films(conn.cursor(), films)
+        conn.commit()
+    else:
+        with get_db_connection() as conn:
+            _save_films(conn.cursor(), films)
+    invalidate_film_cache([film.get('slug') or film.get('letterboxd_slug') for film in films])
+
+
+# How a provided value is merged into an existing row by the bulk UPSERT, mirroring the
+# per-film UPDATE in _save_film:
+#   'present'  - overwrite whenever the key is in the film dict (even with None)
+#   'not_null' - overwrite only with a non-None value
+#   'truthy'   - overwrite only with a non-empty value
+_UPSERT_MERGE = {
+    'letterboxd_id': 'present',
+    'title': 'truthy',
+    'year': 'not_null',
+    'tmdb_id': 'present',
+    'letterboxd_watches': 'not_null',
+    'letterboxd_likes': 'not_null',
+    'letterboxd_lists': 'not_null',
+    'letterboxd_rating': 'not_null',
+    'popularity': 'present',
+    'vote_count': 'present',
+    'vote_average': 'present',
+    'poster_path': 'present',
+    'original_language': 'present',
+    'runtime': 'present',
+    'budget': 'present',
+    'revenue': 'present',
+    'director': 'truthy',
+    'genres': 'present',
+    'production_countries': 'present',
+}
+# Stored as JSON text; new rows get '[]' even when the film dict omits them
+_JSON_LIST_COLUMNS = ('genres', 'production_countries')
+
+
+@lru_cache(maxsize=64)
+def _upsert_sql(keys: tuple, has_updated_at: bool) -> str:
+    """
+    INSERT ... ON CONFLICT DO UPDATE for films providing exactly `keys`.
+
+    Only the provided columns are written on conflict, so batches of same-shaped films
+    (the common case) share one prepared statement and don't churn unrelated indexes.
+    Parameters are positional: slug, then `keys`, then any JSON list columns not in keys.
+    """
+    insert_cols = ['letterboxd_slug', *keys, *(c for c in _JSON_LIST_COLUMNS if c not in keys)]
+    values = ['?'] * len(insert_cols)
+    updates = []
+    for i, col in enumerate(keys, 1):
+        rule = _UPSERT_MERGE[col]
+        if rule == 'present':
+            updates.append(f"{col} = excluded.{col}")
+        elif rule == 'not_null':
+            updates.append(f"{col} = COALESCE(excluded.{col}, {col})")
         else:
-            # Insert new film - check which columns exist first
-            cursor.execute("PRAGMA table_info(films)")
-            columns = [row[1] for row in cursor.fetchall()]
-            
-            # Build column list based on what exists
-            insert_cols = []
-            insert_vals = []
-            placeholders = []
-            
-            # Required columns
-            insert_cols.append('letterboxd_slug')
-            insert_vals.append(slug)
-            placeholders.append('?')
-            
-            # Optional columns (only if they exist in schema)
-            optional_fields = [
-                ('letterboxd_id', film.get('letterboxd_id')),
-                ('title', film.get('title')),
-                ('year', film.get('year')),
-                ('tmdb_id', film.get('tmdb_id')),
-                ('letterboxd_watches', film.get('letterboxd_watches')),
-                ('letterboxd_likes', film.get('letterboxd_likes')),
-                ('letterboxd_lists', film.get('letterboxd_lists')),
-                ('letterboxd_rating', film.get('letterboxd_rating')),
-                ('popularity', film.get('popularity')),
-                ('vote_count', film.get('vote_count')),
-                ('vote_average', film.get('vote_average')),
-                ('poster_path', film.get('poster_path')),
-                ('original_language', film.get('original_language')),
-                ('runtime', film.get('runtime')),
-                ('budget', film.get('budget')),
-                ('revenue', film.get('revenue')),
-                ('director', film.get('director')),
-                ('genres', genres_json),
-                ('production_countries', countries_json),
-            ]
-            
-            for col_name, col_value in optional_fields:
-                if col_name in columns:
-                    insert_cols.append(col_name)
-                    insert_vals.append(col_value)
-                    placeholders.append('?')
-            
-            # Insert with dynamic column list
-            if len(insert_cols) > 1:  # At least slug + one other column
-                insert_sql = f"INSERT INTO films ({', '.join(insert_cols)}) VALUES ({', '.join(placeholders)})"
-                cursor.execute(insert_sql, insert_vals)
+            updates.append(f"{col} = COALESCE(NULLIF(excluded.{col}, ''), {col})")
+    # Updates may omit the title (or pass None); fall back to the stored one so the
+    # NOT NULL check on the proposed row passes and the conflict turns into an UPDATE.
+    # A new film without a title still fails it, as before.
+    stored_title = "(SELECT title FROM films WHERE letterboxd_slug = ?1)"
+    if 'title' in keys:
+        values[insert_cols.index('title')] = f"COALESCE(?, {stored_title})"
+    else:
+        insert_cols.append('title')
+        values.append(stored_title)
+    if has_updated_at:
+        updates.append('updated_at = CURRENT_TIMESTAMP')
+    conflict = f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+    return (
+        f"INSERT INTO films ({', '.join(insert_cols)}) VALUES ({', '.join(values)}) "
+        f"ON CONFLICT(letterboxd_slug) {conflict}"
+    )
+
 
+def _save_films(cursor: sqlite3.Cursor, films: List[Dict]) -> None:
+    """
+    Save films on one cursor with executemany UPSERTs, skipping (not aborting on)
+    films that violate constraints.
+    """
+    columns = _get_film_columns(cursor)
+    has_updated_at = 'updated_at' in columns
+    mergeable = tuple(col for col in _UPSERT_MERGE if col in columns)
 
-def save_films(films: List[Dict]) -> None:
-    """Save multiple films to the database."""
+    # Consecutive films with the same set of keys share one statement; grouping runs
+    # (rather than sorting) keeps the original order for repeated slugs.
+    groups = []
     for film in films:
-        save_film(film)
+        slug = film.get('slug') or film.get('letterboxd_slug')
+        if not slug:
+            continue  # Can't save without a slug
+        keys = tuple(col for col in mergeable if col in film)
+        row = [slug]
+        for col in keys:
+            row.append(_json_list(film[col]) if col in _JSON_LIST_COLUMNS else film[col])
+        for col in _JSON_LIST_COLUMNS:
+            if col not in keys:
+                row.append('[]')
+        if groups and groups[-1][0] == keys:
+            groups[-1][1].append((film, row))
+        else:
+            groups.append((keys, [(film, row)]))
+
+    for keys, rows in groups:
+        try:
+            _executemany_skipping(cursor, _upsert_sql(keys, has_updated_at), rows)
+        except sqlite3.OperationalError as e:
+            if 'ON CONFLICT' not in str(e):
+                raise
+            # Legacy table without a UNIQUE slug index: ON CONFLICT has nothing to
+            # match, so fall back to the per-film SELECT + UPDATE/INSERT path.
+            for film, _ in rows:
+                try:
+                    _save_film(cursor, film)
+                except sqlite3.IntegrityError as e:
+                    print(f"   ⚠️  Skipping film '{film.get('slug') or film.get('letterboxd_slug')}': {e}")
+
+
+def _executemany_skipping(cursor: sqlite3.Cursor, sql: str, rows: List[tuple]) -> None:
+    """executemany over (film, params) pairs, skipping rows that raise IntegrityError."""
+    # executemany pulls parameters lazily, so the last row handed out is the one that
+    # failed; resuming the same iterator skips it and keeps the rest of the batch.
+    remaining = iter(rows)
+    current = [None]
+
+    def params():
+        for film, row in remaining:
+            current[0] = film
+            yield row
+
+    while True:
+        try:
+            cursor.executemany(sql, params())
+            return
+        except sqlite3.IntegrityError as e:
+            # e.g. a new film whose page failed to parse has no title - skip it
+            # rather than rolling back the rest of the batch.
+            film = current[0]
+            print(f"   ⚠️  Skipping film '{film.get('slug') or film.get('letterboxd_slug')}': {e}")
+
+
+def get_all_film_slugs() -> set:
+    """
+    Every slug in the database, as a set.
+
+    Loaded once per scrape run for "do we already have this film?" checks, instead of
+    fetching (and building dicts for) candidate films one lookup at a time. Answered
+    from the slug index alone.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("SELECT letterboxd_slug FROM films")
+        return {slug for (slug,) in cursor}
 
 
 def get_recent_film_slugs(min_year: int) -> List[str]:
@@ -410,30 +966,86 @@ def get_recent_film_slugs(min_year: int) -> List[str]:
     Return slugs of films released in min_year or later.
 
     Used by the weekly refresh to re-fetch watch counts for recent releases,
-    whose numbers change fastest.
+    whose numbers change fastest. The list is read in one go (a few thousand short
+    strings) rather than streamed off the cursor: a read snapshot held open for the
+    whole enrichment run would pin the WAL while the refresh writes back, growing it
+    and keeping wal_checkpoint(TRUNCATE) busy until the run ends.
     """
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        cursor.row_factory = None
         cursor.execute(
             "SELECT letterboxd_slug FROM films WHERE year IS NOT NULL AND year >= ? "
             "AND letterboxd_slug IS NOT NULL AND letterboxd_slug != ''",
             (min_year,),
         )
-        return [row['letterboxd_slug'] for row in cursor.fetchall()]
+        return [row[0] for row in cursor.fetchall()]
+
+
+def checkpoint_database(retries: int = 5, delay: float = 0.5) -> None:
+    """Fold the WAL back into the main database file (run before copying/compressing it).
+
+    Raises sqlite3.OperationalError if readers/writers keep the checkpoint from
+    completing, since the main file alone would then be missing recent writes.
+    """
+    for attempt in range(retries):
+        with get_db_connection() as conn:
+            busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+        if not busy:
+            return
+        time.sleep(delay * (attempt + 1))
+    raise sqlite3.OperationalError("wal_checkpoint(TRUNCATE) stayed busy; WAL not folded into the database")
+
+
+# get_stats() result per DB_PATH, as (expires_at, stats). /stats can be polled by
+# monitors, and the counts only move when films are saved (which clears this too).
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "60"))
+_stats_cache: Dict[str, tuple] = {}
 
 
 def get_stats() -> Dict:
-    """Get database statistics."""
+    """Get database statistics (cached for STATS_CACHE_TTL seconds)."""
+    entry = _stats_cache.get(DB_PATH)
+    if entry is not None and entry[0] > time.monotonic():
+        return dict(entry[1])
+    
+    generation = _film_cache_generation
+    stats = _count_stats()
+    with _film_cache_lock:
+        # Skip caching if a save landed while we were counting
+        if generation == _film_cache_generation:
+            _stats_cache[DB_PATH] = (time.monotonic() + STATS_CACHE_TTL, stats)
+    return dict(stats)
+
+
+def get_data_version() -> str:
+    """
+    Token that changes whenever the database is written (by this or any other process):
+    the modification times of the DB file and its WAL. Used for HTTP validators.
+    """
+    parts = []
+    for path in (DB_PATH, DB_PATH + "-wal"):
+        try:
+            parts.append(str(os.stat(path).st_mtime_ns))
+        except OSError:
+            parts.append("0")
+    return "-".join(parts)
+
+
+def _count_stats() -> Dict:
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as total FROM films")
-        total = cursor.fetchone()['total']
-        
-        cursor.execute("SELECT COUNT(*) as with_watches FROM films WHERE letterboxd_watches IS NOT NULL")
-        with_watches = cursor.fetchone()['with_watches']
-        
-        cursor.execute("SELECT COUNT(*) as with_tmdb FROM films WHERE tmdb_id IS NOT NULL")
-        with_tmdb = cursor.fetchone()['with_tmdb']
+        cursor.row_factory = None
+        # One statement, but each count is its own scalar subquery so SQLite can answer
+        # it from a covering index (idx_year / idx_letterboxd_watches / idx_tmdb_id).
+        # A single SUM(... IS NOT NULL) / COUNT(col) aggregate has to scan the table
+        # instead and is ~10x slower on the shipped DB.
+        cursor.execute(
+            "SELECT (SELECT COUNT(*) FROM films), "
+            "(SELECT COUNT(*) FROM films WHERE letterboxd_watches IS NOT NULL), "
+            "(SELECT COUNT(*) FROM films WHERE tmdb_id IS NOT NULL)"
+        )
+        total, with_watches, with_tmdb = cursor.fetchone()
         
         return {
             'total_films': total,
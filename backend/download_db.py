@@ -10,6 +10,8 @@ import sqlite3
 import requests
 from pathlib import Path
 
+from database import close_db_connections, invalidate_film_cache
+
 MIN_FILMS_WITH_WATCHES = 100  # Minimum expected films with watch counts
 
 def check_database_valid(db_path: str) -> bool:
@@ -17,21 +19,29 @@ def check_database_valid(db_path: str) -> bool:
     if not os.path.exists(db_path):
         return False
     
+    # A read-only open of a WAL database still creates -wal/-shm; remove the ones we create
+    side_files = [db_path + suffix for suffix in ("-wal", "-shm")]
+    preexisting = {path for path in side_files if os.path.exists(path)}
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Check for films table
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='films'")
-        if not cursor.fetchone():
-            print(f"   ⚠️ Database missing 'films' table")
+        # Read-only: a check must never create or modify the file (and takes no write locks)
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            cursor = conn.cursor()
+            
+            # Check for films table
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='films'")
+            if not cursor.fetchone():
+                print(f"   ⚠️ Database missing 'films' table")
+                return False
+            
+            # Check for films with watch counts (answered from idx_letterboxd_watches)
+            cursor.execute("SELECT COUNT(*) FROM films WHERE letterboxd_watches IS NOT NULL AND letterboxd_watches > 0")
+            films_with_watches = cursor.fetchone()[0]
+        finally:
             conn.close()
-            return False
-        
-        # Check for films with watch counts
-        cursor.execute("SELECT COUNT(*) FROM films WHERE letterboxd_watches IS NOT NULL AND letterboxd_watches > 0")
-        films_with_watches = cursor.fetchone()[0]
-        conn.close()
+            for path in side_files:
+                if path not in preexisting and os.path.exists(path):
+                    os.remove(path)
         
         print(f"   📊 Database has {films_with_watches} films with watch counts")
         
@@ -44,10 +54,16 @@ def check_database_valid(db_path: str) -> bool:
         print(f"   ⚠️ Error checking database: {e}")
         return False
 
+def remove_wal_files(db_path: str) -> None:
+    """Delete the -wal/-shm side files, which belong to the old database and would corrupt a new one."""
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
 def download_database_from_github():
     """Download and decompress database from GitHub if it doesn't exist or is incomplete."""
     db_path = os.getenv("DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "films_complete.db"))
-    db_gz_path = db_path + ".gz"
+    tmp_path = db_path + ".download"
     
     # Check if database exists AND has sufficient data
     print(f"🔍 Checking database at {db_path}...")
@@ -58,7 +74,9 @@ def download_database_from_github():
         else:
             print(f"🔄 Database exists but is incomplete - will re-download")
             # Remove the incomplete database
+            close_db_connections()
             os.remove(db_path)
+            remove_wal_files(db_path)
     
     # GitHub raw URL
     github_url = "https://raw.githubusercontent.com/bassiarmaan/obscuriboxd/main/backend/films_complete.db.gz"
@@ -66,25 +84,24 @@ def download_database_from_github():
     print(f"📥 Downloading database from GitHub...")
     
     try:
-        # Download the compressed file
+        # Download and decompress in one pass: only the decompressed bytes hit the disk,
+        # and the .gz never has to be written, re-read and deleted.
         response = requests.get(github_url, stream=True, timeout=60)
         response.raise_for_status()
+        # urllib3 undoes any Content-Encoding the server applied in transit; the
+        # .db.gz payload's own gzip layer is left to GzipFile below
+        response.raw.decode_content = True
         
-        # Save to temporary location
-        with open(db_gz_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        print(f"✅ Downloaded {os.path.getsize(db_gz_path) / (1024*1024):.1f} MB")
-        
-        # Decompress
-        print(f"🗜️  Decompressing database...")
-        with gzip.open(db_gz_path, 'rb') as f_in:
-            with open(db_path, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
+        print(f"🗜️  Decompressing database while downloading...")
+        with gzip.GzipFile(fileobj=response.raw) as f_in, open(tmp_path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out, length=1 << 20)
         
-        # Remove compressed file
-        os.remove(db_gz_path)
+        # Only replace db_path once the whole file has arrived; pooled connections
+        # and the old WAL must go first or SQLite would replay stale pages into it
+        close_db_connections()
+        remove_wal_files(db_path)
+        os.replace(tmp_path, db_path)
+        invalidate_film_cache()  # cached films (and stats) came from the old file
         
         print(f"✅ Database ready at {db_path} ({os.path.getsize(db_path) / (1024*1024):.1f} MB)")
         
@@ -97,13 +114,17 @@ def download_database_from_github():
     except requests.exceptions.RequestException as e:
         print(f"⚠️  Could not download database from GitHub: {e}")
         print(f"   The app will start with an empty database and build it over time.")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
     except Exception as e:
         print(f"⚠️  Error setting up database: {e}")
         # Clean up partial files
-        if os.path.exists(db_gz_path):
-            os.remove(db_gz_path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        close_db_connections()
         if os.path.exists(db_path):
             os.remove(db_path)
+        remove_wal_files(db_path)
 
 if __name__ == "__main__":
     download_database_from_github()
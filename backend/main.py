@@ -1,10 +1,17 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from scraper import get_user_films
 from calculator import calculate_obscurity_stats
-from database import init_database, get_stats
+from database import init_database, get_stats, get_data_version, json_dumps, json_loads
+import asyncio
+import hashlib
+import itertools
 import os
+import time
+from collections import OrderedDict
 
 app = FastAPI(title="Obscuriboxd API", version="1.0.0")
 DATA_SOURCE_MARKER = "_obscuriboxd_data_source"
@@ -25,28 +32,34 @@ if frontend_url:
     # Also allow the base domain without path
     frontend_origins.append(frontend_url.rstrip("/"))
 
-# Allow all Vercel preview URLs
-frontend_origins.append("https://*.vercel.app")
-
+# Vercel preview URLs are matched by allow_origin_regex below (Starlette compiles it once);
+# a "https://*.vercel.app" entry here would only ever match that literal string.
+# Exact origins are checked with `in`, so hand the middleware a set.
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=frontend_origins,
+    allow_origins=frozenset(frontend_origins),
     allow_origin_regex=r"https://.*\.vercel\.app",
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Initialize database on startup
-@app.on_event("startup")
-async def startup_event():
-    # Try to download database from GitHub if it doesn't exist (BEFORE init)
+# Seconds a request waits for the startup download/init before giving up with a 503
+DB_READY_TIMEOUT = float(os.getenv("DB_READY_TIMEOUT", "60"))
+
+# Startup database preparation, running in the background (None until startup runs)
+_db_ready_task: asyncio.Task | None = None
+
+
+async def _prepare_database():
+    # Try to download database from GitHub if it doesn't exist (BEFORE init).
+    # Download, decompression and init are blocking, so they run in a worker thread.
     from download_db import download_database_from_github
-    download_database_from_github()
+    await asyncio.to_thread(download_database_from_github)
     
     # Initialize database (will create schema if needed, or use existing)
-    init_database()
-    stats = get_stats()
+    await asyncio.to_thread(init_database)
+    stats = await asyncio.to_thread(get_stats)
     print(f"💾 Database initialized. Total films: {stats['total_films']}")
     if stats['total_films'] > 0:
         print(f"   ✅ Database is ready - films will be pulled from DB when available")
@@ -54,6 +67,41 @@ async def startup_event():
         print(f"   ⚠️  Database is empty - films will be scraped and saved")
 
 
+def _database_ready() -> bool:
+    return _db_ready_task is None or _db_ready_task.done()
+
+
+def _database_failed() -> bool:
+    return (
+        _db_ready_task is not None and _db_ready_task.done()
+        and (_db_ready_task.cancelled() or _db_ready_task.exception() is not None)
+    )
+
+
+async def _wait_for_database():
+    """Hold DB-backed requests until startup preparation finishes (503 if it takes too long or failed)."""
+    if not _database_ready():
+        await asyncio.wait({_db_ready_task}, timeout=DB_READY_TIMEOUT)
+        if not _db_ready_task.done():
+            raise HTTPException(status_code=503, detail="Database is still loading, please retry shortly")
+    if _database_failed():
+        raise HTTPException(status_code=503, detail="Database is unavailable")
+
+
+def _report_prepare_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Database setup failed: {task.exception()}")
+
+
+# Initialize database on startup - in the background, so the app (and /health) is up
+# while a cold instance is still fetching the database from GitHub
+@app.on_event("startup")
+async def startup_event():
+    global _db_ready_task
+    _db_ready_task = asyncio.create_task(_prepare_database())
+    _db_ready_task.add_done_callback(_report_prepare_failure)
+
+
 class AnalyzeRequest(BaseModel):
     username: str
 
@@ -86,20 +134,58 @@ class AnalyzeResponse(BaseModel):
     data_note: str | None = None
 
 
+# Read endpoints may be reused by browsers/CDNs briefly, then revalidated via ETag
+READ_CACHE_CONTROL = os.getenv("READ_CACHE_CONTROL", "public, max-age=60, s-maxage=300")
+
+
+def _etag(*parts) -> str:
+    key = "|".join(str(p) for p in parts)
+    return f'W/"{hashlib.blake2b(key.encode(), digest_size=12).hexdigest()}"'
+
+
+def _cache_headers(etag: str | None = None) -> dict:
+    headers = {"Cache-Control": READ_CACHE_CONTROL}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def _not_modified(request: Request, etag: str) -> Response | None:
+    """A 304 if the client's If-None-Match already names this ETag, else None."""
+    tags = request.headers.get("if-none-match")
+    if tags and (tags.strip() == "*" or etag in (t.strip() for t in tags.split(","))):
+        return Response(status_code=304, headers=_cache_headers(etag))
+    return None
+
+
 @app.get("/")
-async def root():
+async def root(response: Response):
+    response.headers.update(_cache_headers())
     return {"message": "Obscuriboxd API", "version": "1.0.0"}
 
 
 @app.get("/health")
-async def health():
-    return {"status": "healthy"}
+async def health(response: Response):
+    # Platform health checks only read the status code, so a failed startup must be a
+    # 503 for the instance to be restarted; "starting" stays 200 while the DB downloads
+    if _database_failed():
+        response.status_code = 503
+        return {"status": "unavailable"}
+    return {"status": "healthy" if _database_ready() else "starting"}
 
 
 @app.get("/stats")
-async def database_stats():
+async def database_stats(request: Request, response: Response):
     """Get database statistics."""
-    return get_stats()
+    await _wait_for_database()
+    # async so it can wait on startup preparation; the count itself runs in a worker thread
+    stats = await asyncio.to_thread(get_stats)
+    etag = _etag(*sorted(stats.items()))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    response.headers.update(_cache_headers(etag))
+    return stats
 
 
 @app.get("/debug/fetch")
@@ -138,69 +224,248 @@ async def debug_fetch(url: str, token: str = ""):
         }
 
 
+# Pages up to this many rows are answered in one body; larger ones are streamed,
+# fetching this many rows per chunk
+FILMS_STREAM_BATCH = 500
+
+
 @app.get("/films")
-async def list_films(limit: int = 50, offset: int = 0):
-    """List films in the database."""
-    from database import get_db_connection
-    import json
+async def list_films(
+    request: Request,
+    limit: int = 50,
+    offset: int = 0,
+    after_watches: int | None = None,
+    after_slug: str | None = None,
+):
+    """
+    List films in the database, most watched first.
+
+    Pass the previous page's `next_after` values as after_watches/after_slug to page by
+    key instead of OFFSET, so deep pages don't re-scan everything before them. Films
+    without a watch count come last; there next_after's after_watches is null, and the
+    parameter is simply left out.
+    """
+    await _wait_for_database()
+    keyset = after_slug is not None
+    etag = _etag(get_data_version(), limit, offset, after_watches, after_slug)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
     
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Get total count
-        cursor.execute("SELECT COUNT(*) as total FROM films")
-        total = cursor.fetchone()['total']
-        
-        # Get films
-        cursor.execute("""
-            SELECT 
-                title, year, letterboxd_slug, letterboxd_watches,
-                director, genres, production_countries
+    if limit <= FILMS_STREAM_BATCH:
+        page = await run_in_threadpool(_films_page, limit, offset, after_watches, after_slug, keyset)
+        return Response(json_dumps(page), media_type="application/json", headers=_cache_headers(etag))
+    
+    # The first chunk runs the count and first batch, so a database error is still a
+    # 500 here rather than a truncated 200 body
+    body = _stream_films(limit, offset, after_watches, after_slug, keyset)
+    head = await run_in_threadpool(next, body)
+    return StreamingResponse(
+        itertools.chain((head,), body),
+        media_type="application/json",
+        headers=_cache_headers(etag),
+    )
+
+
+def _loads_list(text: str) -> list:
+    """Decode a genres/countries column, treating corrupt JSON as an empty list."""
+    try:
+        return json_loads(text)
+    except ValueError:
+        return []
+
+
+def _row_to_film(row: tuple) -> dict:
+    """Build a /films entry from a (title, year, slug, watches, director, genres, countries) row."""
+    title, year, slug, watches, director, genres, countries = row
+    film = {'title': title, 'year': year, 'slug': slug, 'watches': watches, 'director': director}
+    if genres:
+        film['genres'] = _loads_list(genres)
+    if countries:
+        film['countries'] = _loads_list(countries)
+    return film
+
+
+# Column order _row_to_film unpacks
+_FILM_COLUMNS = "title, year, letterboxd_slug, letterboxd_watches, director, genres, production_countries"
+
+
+def _count_films(conn) -> int:
+    return conn.execute("SELECT COUNT(*) FROM films").fetchone()[0]
+
+
+def _select_films(conn, limit: int, offset: int, after_watches, after_slug, keyset: bool) -> list:
+    """Rows for one /films page (or one streamed batch of it), as plain tuples."""
+    cursor = conn.cursor()
+    cursor.row_factory = None  # plain tuples, unpacked by _row_to_film
+    
+    # Get films (slug breaks ties so pages are stable; every branch is a SEARCH or SCAN of
+    # idx_films_watches_cover). Films without a watch count sort last and are paged by
+    # slug alone once the counted ones run out.
+    if keyset and after_watches is None:
+        cursor.execute(f"""
+            SELECT {_FILM_COLUMNS}
+            FROM films 
+            WHERE letterboxd_watches IS NULL AND letterboxd_slug < ?
+            ORDER BY letterboxd_slug DESC
+            LIMIT ?
+        """, (after_slug, limit))
+    elif keyset:
+        # Both halves seek the index; the merge keeps the overall order without an OR
+        # that would turn the seek into a scan from the top
+        cursor.execute(f"""
+            SELECT * FROM (
+                SELECT {_FILM_COLUMNS} FROM films
+                WHERE (letterboxd_watches, letterboxd_slug) < (?, ?)
+                ORDER BY letterboxd_watches DESC, letterboxd_slug DESC
+                LIMIT ?
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT {_FILM_COLUMNS} FROM films
+                WHERE letterboxd_watches IS NULL
+                ORDER BY letterboxd_slug DESC
+                LIMIT ?
+            )
+            ORDER BY letterboxd_watches DESC, letterboxd_slug DESC
+            LIMIT ?
+        """, (after_watches, after_slug, limit, limit, limit))
+    else:
+        cursor.execute(f"""
+            SELECT {_FILM_COLUMNS}
             FROM films 
-            ORDER BY letterboxd_watches DESC
+            ORDER BY letterboxd_watches DESC, letterboxd_slug DESC
             LIMIT ? OFFSET ?
         """, (limit, offset))
-        
-        rows = cursor.fetchall()
-        films = []
-        for row in rows:
-            film = {
-                'title': row['title'],
-                'year': row['year'],
-                'slug': row['letterboxd_slug'],
-                'watches': row['letterboxd_watches'],
-                'director': row['director'],
-            }
-            if row['genres']:
-                try:
-                    film['genres'] = json.loads(row['genres'])
-                except:
-                    film['genres'] = []
-            if row['production_countries']:
-                try:
-                    film['countries'] = json.loads(row['production_countries'])
-                except:
-                    film['countries'] = []
-            films.append(film)
-        
-        return {
-            'total': total,
-            'limit': limit,
-            'offset': offset,
-            'films': films
-        }
+    return cursor.fetchall()
+
+
+def _next_after(last: tuple | None, count: int, limit: int) -> dict | None:
+    """Keyset cursor for the page after one that returned `count` rows ending in `last`."""
+    if last is None or count < limit:
+        return None
+    return {'after_watches': last[3], 'after_slug': last[2]}
+
+
+def _films_page(limit: int, offset: int, after_watches, after_slug, keyset: bool) -> dict:
+    """The whole /films body for a page small enough to build in memory."""
+    from database import get_db_connection
+    
+    with get_db_connection() as conn:
+        total = _count_films(conn)
+        rows = _select_films(conn, limit, offset, after_watches, after_slug, keyset)
+    
+    return {
+        'total': total,
+        'limit': limit,
+        'offset': None if keyset else offset,
+        'next_after': _next_after(rows[-1] if rows else None, len(rows), limit),
+        'films': [_row_to_film(row) for row in rows],
+    }
+
+
+def _stream_films(limit: int, offset: int, after_watches, after_slug, keyset: bool):
+    """
+    Yield the /films JSON body a batch of rows at a time, so large pages are never held
+    in memory as one list. Each batch is read on its own short pooled connection and
+    continues by keyset from the previous batch's last row, so no connection or read
+    transaction is held between chunks, or after the client goes away.
+    """
+    from database import get_db_connection
+    
+    batch = min(limit, FILMS_STREAM_BATCH)
+    with get_db_connection() as conn:
+        total = _count_films(conn)
+        rows = _select_films(conn, batch, offset, after_watches, after_slug, keyset)
+    
+    offset_value = 'null' if keyset else json_dumps(offset)
+    yield f'{{"total":{json_dumps(total)},"limit":{json_dumps(limit)},"offset":{offset_value},"films":['
+    
+    count = 0
+    last = None
+    while rows:
+        yield (',' if count else '') + ','.join(json_dumps(_row_to_film(row)) for row in rows)
+        count += len(rows)
+        last = rows[-1]
+        if len(rows) < batch or count >= limit:
+            break
+        batch = min(limit - count, FILMS_STREAM_BATCH)
+        with get_db_connection() as conn:
+            rows = _select_films(conn, batch, 0, last[3], last[2], True)
+    
+    yield '],"next_after":' + json_dumps(_next_after(last, count, limit)) + '}'
+
+
+# Finished analyses by username. A profile scrape takes seconds to minutes and a diary
+# rarely changes within hours, so repeat requests are answered from memory.
+ANALYZE_CACHE_TTL = float(os.getenv("ANALYZE_CACHE_TTL", "21600"))  # 6 hours
+ANALYZE_CACHE_SIZE = int(os.getenv("ANALYZE_CACHE_SIZE", "256"))
+_analyze_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+# Analyses currently running, by username
+_analyze_inflight: dict[str, asyncio.Task] = {}
+
+
+def _get_cached_analysis(username: str) -> dict | None:
+    entry = _analyze_cache.get(username)
+    if entry is None:
+        return None
+    stored_at, stats = entry
+    if time.monotonic() - stored_at > ANALYZE_CACHE_TTL:
+        del _analyze_cache[username]
+        return None
+    _analyze_cache.move_to_end(username)
+    return stats
+
+
+def _cache_analysis(username: str, stats: dict) -> None:
+    _analyze_cache[username] = (time.monotonic(), stats)
+    _analyze_cache.move_to_end(username)
+    while len(_analyze_cache) > ANALYZE_CACHE_SIZE:
+        _analyze_cache.popitem(last=False)
 
 
 @app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_user(request: AnalyzeRequest):
+async def analyze_user(request: AnalyzeRequest, refresh: bool = False):
     """
     Analyze a Letterboxd user's film taste and calculate obscurity score.
+    
+    Results are cached per username for ANALYZE_CACHE_TTL seconds; pass ?refresh=true
+    to re-scrape.
     """
     username = request.username.strip().lower()
     
     if not username:
         raise HTTPException(status_code=400, detail="Username is required")
     
+    if not refresh:
+        cached = _get_cached_analysis(username)
+        if cached is not None:
+            print(f"⚡ Returning cached analysis for user: {username}")
+            return cached
+    
+    await _wait_for_database()
+    
+    # Concurrent requests for the same user share one scrape. The shield keeps it
+    # running for the others if this client disconnects.
+    task = _analyze_inflight.get(username)
+    if task is None:
+        task = asyncio.create_task(_run_analysis(username))
+        _analyze_inflight[username] = task
+        task.add_done_callback(lambda t: _analysis_finished(username, t))
+    else:
+        print(f"⏳ Joining in-flight analysis for user: {username}")
+    return await asyncio.shield(task)
+
+
+def _analysis_finished(username: str, task: asyncio.Task) -> None:
+    if _analyze_inflight.get(username) is task:
+        del _analyze_inflight[username]
+    if not task.cancelled():
+        task.exception()  # Mark retrieved; every waiter has already seen it
+
+
+async def _run_analysis(username: str) -> dict:
+    """Scrape and score one user; raises HTTPException for anything the client should see."""
     try:
         # Step 1: Scrape user's films from Letterboxd (includes watch counts, genres, director, countries)
         print(f"🔄 Starting analysis for user: {username}")
@@ -240,6 +505,11 @@ async def analyze_user(request: AnalyzeRequest):
         stats["is_partial_data"] = data_source != "full_scrape"
         stats["data_note"] = data_notes.get(data_source)
 
+        # Partial results aren't cached, so a retry gets the full profile once Letterboxd
+        # stops blocking instead of the degraded answer for hours
+        if not stats["is_partial_data"]:
+            _cache_analysis(username, stats)
+        
         print(f"📤 Returning stats: obscurity_score={stats.get('obscurity_score')}, total_films={stats.get('total_films')}")
         return stats
         
@@ -272,5 +542,12 @@ async def analyze_user(request: AnalyzeRequest):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvicorn[standard] brings uvloop + httptools, which uvicorn picks up automatically.
+    # Each worker prepares the DB and keeps its own caches, so stay at one unless told.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
 
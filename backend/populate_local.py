@@ -11,24 +11,29 @@ Usage:
 
 import asyncio
 import argparse
+import re
 import sys
 import os
 
 # Add the backend directory to the path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from database import init_database, get_stats, save_films, get_films_by_slugs, get_db_connection
+from database import (
+    init_database,
+    get_stats,
+    get_all_film_slugs,
+    get_db_connection,
+    bulk_load_connection,
+    invalidate_film_cache,
+)
 from scraper import (
     get_user_film_list,
-    enrich_with_letterboxd_stats,
+    enrich_and_save,
     fetch_with_cloudflare_bypass,
-    get_popular_film_slugs,
+    iter_popular_film_slugs,
     parse_popular_slugs,
 )
 
-# For direct scraping
-import re
-
 
 def check_database():
     """Check database status and show sample data."""
@@ -74,12 +79,33 @@ def check_database():
                     print(f"   - {row['title']} ({row['year']})")
 
 
+# Slugs already in the DB, loaded on first use and kept current as this run saves films,
+# so checking a user's (or a popular page's) films costs no queries at all.
+_known_slugs: set | None = None
+
+
+def _get_known_slugs() -> set:
+    global _known_slugs
+    if _known_slugs is None:
+        _known_slugs = get_all_film_slugs()
+    return _known_slugs
+
+
+# Slugs already handed to enrichment this run. Films that came back without a title are
+# never saved, so without this every later user/source sharing them would re-fetch them.
+_attempted_slugs: set = set()
+
+
 def filter_new_slugs(slugs: list) -> list:
-    """Return only the slugs that are NOT already in the database (skip existing)."""
+    """
+    Return only the slugs that are NOT already in the database (skip existing), nor
+    already attempted earlier in this run.
+    """
+    known = _get_known_slugs()
     unique = list(dict.fromkeys(s for s in slugs if s))
-    existing = get_films_by_slugs(unique)
-    new_slugs = [s for s in unique if s not in existing]
-    print(f"   {len(existing)} already in DB (skipped), {len(new_slugs)} new to enrich")
+    new_slugs = [s for s in unique if s not in known and s not in _attempted_slugs]
+    _attempted_slugs.update(new_slugs)
+    print(f"   {len(unique) - len(new_slugs)} already in DB or seen this run (skipped), {len(new_slugs)} new to enrich")
     return new_slugs
 
 
@@ -114,22 +140,39 @@ async def backfill_user_films(username: str):
 
 
 async def scrape_popular_films(pages: int = 10):
-    """Scrape popular film slugs from Letterboxd via the CSI list endpoint (curl_cffi)."""
+    """
+    Scrape popular films from Letterboxd via the CSI list endpoint (curl_cffi) and
+    enrich + save the new ones. Pages are enriched as they arrive while later pages
+    are still being fetched, rather than collecting every page first.
+    """
     print(f"\n🌟 Scraping popular films ({pages} pages, ~{pages * 72} films)...")
     print("=" * 50)
 
-    slugs = await get_popular_film_slugs(pages)
-    print(f"\n📊 Collected {len(slugs)} popular slugs; checking which are new...")
-
-    new_slugs = filter_new_slugs(slugs)
+    # A few pages of lookahead; the lister stalls rather than running far ahead
+    page_queue = asyncio.Queue(maxsize=4)
+    total_new = 0
 
-    all_films = [
-        {'slug': slug, 'letterboxd_url': f"https://letterboxd.com/film/{slug}/"}
-        for slug in new_slugs
-    ]
+    async def list_pages():
+        nonlocal total_new
+        try:
+            async for page_slugs in iter_popular_film_slugs(pages):
+                new_slugs = filter_new_slugs(page_slugs)
+                total_new += len(new_slugs)
+                if new_slugs:
+                    await page_queue.put([
+                        {'slug': slug, 'letterboxd_url': f"https://letterboxd.com/film/{slug}/"}
+                        for slug in new_slugs
+                    ])
+        finally:
+            await page_queue.put(None)
+
+    async def enrich_pages():
+        while (films := await page_queue.get()) is not None:
+            await enrich_and_save_films(films)
 
-    print(f"📊 {len(all_films)} new films to enrich.")
-    return all_films
+    await asyncio.gather(list_pages(), enrich_pages())
+    print(f"📊 {total_new} new popular films found.")
+    return total_new
 
 
 async def enrich_and_save_films(films: list):
@@ -139,24 +182,14 @@ async def enrich_and_save_films(films: list):
     
     print(f"\n🔄 Enriching {len(films)} films with Letterboxd data...")
     
-    # Enrich in batches
-    batch_size = 50
-    total_enriched = 0
+    def on_saved(batch: list, total: int):
+        if _known_slugs is not None:
+            _known_slugs.update(f['slug'] for f in batch if f.get('slug') and f.get('title'))
+        print(f"   ✅ Saved {len(batch)} films ({total}/{len(films)})")
     
-    for i in range(0, len(films), batch_size):
-        batch = films[i:i + batch_size]
-        print(f"   Processing batch {i//batch_size + 1} ({len(batch)} films)...")
-        
-        try:
-            enriched = await enrich_with_letterboxd_stats(batch)
-            save_films(enriched)
-            total_enriched += len(enriched)
-            print(f"   ✅ Saved {len(enriched)} films")
-        except Exception as e:
-            print(f"   ⚠️  Batch error: {e}")
-        
-        # Rate limiting
-        await asyncio.sleep(0.2)
+    # One writer connection for the whole run; each batch is committed on it
+    with bulk_load_connection() as conn:
+        total_enriched = await enrich_and_save(films, batch_size=50, conn=conn, on_saved=on_saved)
     
     print(f"\n✅ Total enriched and saved: {total_enriched}")
 
@@ -177,8 +210,30 @@ async def scrape_multiple_users(usernames: list):
     print(f"\n📊 Total new films added across all users: {total_added}")
 
 
+# slugify_title's passes, built once: the table deletes every Latin-1 character that
+# isn't a-z, 0-9, whitespace or '-' in the same C pass as the lookup; _NON_SLUG only
+# runs for the rare title with characters beyond that
+_STRIP = str.maketrans('', '', ''.join(
+    chr(c) for c in range(256)
+    if not (chr(c) in 'abcdefghijklmnopqrstuvwxyz0123456789-' or chr(c).isspace())
+))
+_NON_SLUG = re.compile(r'[^a-z0-9\s-]')
+_SPACES = re.compile(r'\s+')
+_MULTI_HYPHEN = re.compile(r'-+')
+
+
+def slugify_title(title: str) -> str:
+    """Guess a Letterboxd-style slug from a title ("The Thing!" -> "the-thing")."""
+    slug = title.lower().translate(_STRIP)  # Remove special chars
+    if not slug.isascii():
+        slug = _NON_SLUG.sub('', slug)
+    slug = _SPACES.sub('-', slug)  # Replace spaces with hyphens
+    return _MULTI_HYPHEN.sub('-', slug).strip('-')  # Remove multiple hyphens
+
+
 def fix_database_slugs():
     """Try to add slugs to films that are missing them based on title/year matching."""
+    global _known_slugs
     print("\n🔧 Attempting to fix missing slugs...")
     
     with get_db_connection() as conn:
@@ -201,38 +256,30 @@ def fix_database_slugs():
         """)
         rows = cursor.fetchall()
         
-        fixed = 0
+        # Titles shared by more than one film, in one query rather than one per row
+        cursor.execute("SELECT title FROM films WHERE title IS NOT NULL GROUP BY title HAVING COUNT(*) > 1")
+        common_titles = {row['title'] for row in cursor.fetchall()}
+        
+        updates = []
         for row in rows:
             title = row['title']
             year = row['year']
             
             # Generate a slug from title
-            slug = title.lower()
-            slug = re.sub(r'[^a-z0-9\s-]', '', slug)  # Remove special chars
-            slug = re.sub(r'\s+', '-', slug)  # Replace spaces with hyphens
-            slug = re.sub(r'-+', '-', slug)  # Remove multiple hyphens
-            slug = slug.strip('-')
+            slug = slugify_title(title)
             
-            if year:
+            if year and title in common_titles:
                 # Add year if title is common
-                cursor.execute(
-                    "SELECT COUNT(*) as count FROM films WHERE title = ?",
-                    (title,)
-                )
-                if cursor.fetchone()['count'] > 1:
-                    slug = f"{slug}-{year}"
-            
-            # Update the film
-            cursor.execute(
-                "UPDATE films SET letterboxd_slug = ? WHERE id = ?",
-                (slug, row['id'])
-            )
-            fixed += 1
+                slug = f"{slug}-{year}"
             
-            if fixed % 1000 == 0:
-                print(f"   Fixed {fixed:,} films...")
+            updates.append((slug, row['id']))
         
+        # Update the films: one executemany, committed once
+        cursor.executemany("UPDATE films SET letterboxd_slug = ? WHERE id = ?", updates)
+        fixed = len(updates)
         conn.commit()
+        invalidate_film_cache()
+        _known_slugs = None  # reload with the generated slugs on next use
         print(f"   ✅ Generated slugs for {fixed:,} films")
         print("   ⚠️  Note: Generated slugs may not match actual Letterboxd slugs exactly")
 
@@ -262,9 +309,7 @@ async def main():
         return
     
     if args.popular:
-        films = await scrape_popular_films(args.popular_pages)
-        if films:
-            await enrich_and_save_films(films)
+        await scrape_popular_films(args.popular_pages)
         check_database()
         return
     
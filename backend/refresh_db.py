@@ -24,6 +24,7 @@ import datetime
 import gzip
 import os
 import shutil
+import sqlite3
 import sys
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -32,17 +33,19 @@ from database import (
     init_database,
     get_stats,
     save_films,
-    get_films_by_slugs,
+    get_all_film_slugs,
     get_recent_film_slugs,
     get_db_path,
+    checkpoint_database,
 )
-from scraper import enrich_with_letterboxd_stats, get_popular_film_slugs
+from scraper import enrich_and_save, enrich_with_letterboxd_stats, get_popular_film_slugs
 
 
 async def refresh_recent_films(recent_years: int) -> int:
     """Re-fetch watch counts for films released within the last `recent_years` years."""
     current_year = datetime.date.today().year
     min_year = current_year - recent_years
+
     slugs = get_recent_film_slugs(min_year)
 
     if not slugs:
@@ -52,16 +55,13 @@ async def refresh_recent_films(recent_years: int) -> int:
     print(f"\n🔄 Refreshing watch counts for {len(slugs)} films released since {min_year}...")
     films = [{'slug': s, 'letterboxd_url': f"https://letterboxd.com/film/{s}/"} for s in slugs]
 
-    updated = 0
-    batch_size = 200
-    for i in range(0, len(films), batch_size):
-        batch = films[i:i + batch_size]
-        enriched = await enrich_with_letterboxd_stats(batch)
-        save_films(enriched)
-        updated += len(enriched)
-        print(f"   ...refreshed {updated}/{len(films)}")
-
-    return updated
+    # One enrichment run over every film (the scraper bounds how many are in flight),
+    # saved 200 at a time as they finish
+    return await enrich_and_save(
+        films,
+        batch_size=200,
+        on_saved=lambda batch, updated: print(f"   ...refreshed {updated}/{len(films)}"),
+    )
 
 
 async def add_new_popular_films(pages: int) -> int:
@@ -75,7 +75,7 @@ async def add_new_popular_films(pages: int) -> int:
         print("   ⚠️ Could not fetch popular films (blocked or empty).")
         return 0
 
-    existing = get_films_by_slugs(slugs)
+    existing = get_all_film_slugs()
     new_slugs = [s for s in slugs if s not in existing]
     print(f"   {len(new_slugs)} new films not yet in the DB.")
 
@@ -92,6 +92,11 @@ def compress_db() -> None:
     """Compress films_complete.db -> films_complete.db.gz for production download."""
     db_path = get_db_path()
     gz_path = db_path + ".gz"
+    try:
+        checkpoint_database()  # WAL mode: make sure recent writes are in the main file
+    except sqlite3.OperationalError as e:
+        print(f"⚠️  Could not checkpoint the WAL ({e}); not compressing a stale {db_path}")
+        return
     print(f"\n🗜️  Compressing {db_path} -> {gz_path}...")
     with open(db_path, 'rb') as f_in:
         with gzip.open(gz_path, 'wb', compresslevel=9) as f_out:
@@ -8,9 +8,13 @@ import asyncio
 import aiohttp
 import random
 from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 import re
 import os
+from typing import Callable
 from database import save_films, get_films_by_slugs
+from backoff import RateLimiter, backoff_delay, retry_after_seconds
 from aiohttp import ClientTimeout
 
 # Import curl_cffi for browser-fingerprinted requests (defeats Cloudflare TLS/JA3 fingerprinting).
@@ -43,6 +47,15 @@ FETCH_RETRIES = int(os.getenv("SCRAPE_FETCH_RETRIES", "5"))
 PAGE_RECOVERY_ATTEMPTS = int(os.getenv("SCRAPE_PAGE_RECOVERY", "3"))
 BLOCK_COOLDOWN_BASE = float(os.getenv("SCRAPE_BLOCK_COOLDOWN", "4.0"))
 
+
+class RateLimitedError(Exception):
+    """HTTP 429 from Letterboxd; retry_after is the wait the server asked for, if any."""
+
+    def __init__(self, retry_after: float | None):
+        super().__init__("HTTP 429 Too Many Requests")
+        self.retry_after = retry_after
+
+
 # Import TMDb functions for poster fetching
 try:
     from tmdb import search_film, TMDB_API_KEY
@@ -56,6 +69,66 @@ import xml.etree.ElementTree as ET
 
 DATA_SOURCE_MARKER = "_obscuriboxd_data_source"
 
+# Patterns used per film / per poster while parsing, compiled once
+_FILM_PATH_RE = re.compile(r'/film/')
+_FILM_SLUG_RE = re.compile(r'/film/([^/]+)/?')
+_FILM_SLUG_DIR_RE = re.compile(r'/film/([^/]+)/')  # trailing slash required
+_FILM_SLUG_END_RE = re.compile(r'/film/([^/]+)/?$')
+_FILM_HREF_RE = re.compile(r'^/film/([^/]+)/?$')
+_FILM_SLUG_IN_HTML_RE = re.compile(r'/film/([a-z0-9:.-]+)/')
+_RSS_POSTER_RE = re.compile(r'<img src="([^"]+)"')
+# aria-labels read "Watched by 6,234,540&nbsp;members"; only the digits after "by" matter
+_WATCHED_RE = re.compile(r'Watched by ([\d,]+)')
+_LIKED_RE = re.compile(r'Liked by ([\d,]+)')
+_LISTS_RE = re.compile(r'Appears in ([\d,]+)')
+_TITLE_YEAR_RE = re.compile(r'\((\d{4})\)')
+_NAME_YEAR_END_RE = re.compile(r'\((\d{4})\)$')
+_TRAILING_YEAR_RE = re.compile(r'\s*\(\d{4}\)\s*$')
+_YEAR_PAREN_RE = re.compile(r'\s*\(\d{4}\)\s*')
+_YEAR_RE = re.compile(r'(\d{4})')
+
+
+def _has_class(name: str) -> str:
+    """XPath predicate equivalent to the CSS class selector `.name`."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _stat_label_xpath(kind: str) -> etree.XPath:
+    """aria-label of the first `.production-statistic.-<kind>` element."""
+    return etree.XPath(
+        f"(//*[{_has_class('production-statistic')} and {_has_class('-' + kind)}])[1]/@aria-label"
+    )
+
+
+# (stats key, label XPath, count pattern) for parse_stats_html
+_STAT_LABELS = (
+    ('letterboxd_watches', _stat_label_xpath('watches'), _WATCHED_RE),
+    ('letterboxd_likes', _stat_label_xpath('likes'), _LIKED_RE),
+    ('letterboxd_lists', _stat_label_xpath('lists'), _LISTS_RE),
+)
+
+
+# First-match lookups for parse_film_page (mirroring the CSS selectors it used to run
+# through BeautifulSoup); `h1.headline-1` precedes any `.name` inside it, so it covers
+# the old `h1.headline-1 .name, h1.headline-1` select_one too.
+_FILM_PAGE_XPATHS = {
+    'og_title': etree.XPath('(//meta[@property="og:title"])[1]/@content'),
+    'headline': etree.XPath(f'(//h1[{_has_class("headline-1")}])[1]'),
+    'year_link': etree.XPath('(//a[contains(@href, "/films/year/")])[1]'),
+    'og_image': etree.XPath('(//meta[@property="og:image"])[1]/@content'),
+    'director': etree.XPath('(//a[contains(@href, "/director/")])[1]'),
+    'genres': etree.XPath(f'//*[@id="tab-genres"]//a[{_has_class("text-slug")}]'),
+    'countries': etree.XPath('//a[contains(@href, "/films/country/")]'),
+    'rating': etree.XPath('(//meta[@name="twitter:data2"])[1]/@content'),
+}
+
+
+# DB columns the obscurity analysis reads; the rest of the stored film (TMDb ids,
+# popularity, likes/lists...) isn't copied onto the user's films.
+ANALYSIS_FIELDS = (
+    'title', 'year', 'letterboxd_watches', 'director', 'poster_path', 'genres', 'production_countries',
+)
+
 
 async def get_user_films_from_rss(username: str) -> list[dict]:
     """
@@ -122,7 +195,7 @@ async def get_user_films_from_rss(username: str) -> list[dict]:
             if link_elem is not None and link_elem.text:
                 link = link_elem.text
                 # Extract slug from link like https://letterboxd.com/armbot/film/marty-supreme/
-                slug_match = re.search(r'/film/([^/]+)/?$', link)
+                slug_match = _FILM_SLUG_END_RE.search(link)
                 if slug_match:
                     film['slug'] = slug_match.group(1)
             
@@ -162,7 +235,7 @@ async def get_user_films_from_rss(username: str) -> list[dict]:
             # Extract poster URL from description (it's in an img tag)
             description = item.find('description')
             if description is not None and description.text:
-                poster_match = re.search(r'<img src="([^"]+)"', description.text)
+                poster_match = _RSS_POSTER_RE.search(description.text)
                 if poster_match:
                     film['poster_path'] = poster_match.group(1)
             
@@ -362,7 +435,7 @@ async def get_user_films(username: str) -> list[dict]:
     # Check database first for existing films
     slugs = [f.get('slug') for f in films if f.get('slug')]
     print(f"🔍 Looking up {len(slugs)} film slugs in database...")
-    db_films = get_films_by_slugs(slugs)
+    db_films = await asyncio.to_thread(get_films_by_slugs, slugs)
     print(f"   Found {len(db_films)} films in database")
     
     # DB-only enrichment: watch counts and film metadata come entirely from our
@@ -383,7 +456,9 @@ async def get_user_films(username: str) -> list[dict]:
         if slug and slug in db_films:
             # Film exists in database - use DB data but keep the user's own rating.
             db_film = db_films[slug]
-            film.update({k: v for k, v in db_film.items() if k != 'user_rating'})
+            for key in ANALYSIS_FIELDS:
+                if key in db_film:
+                    film[key] = db_film[key]
             from_db_count += 1
         else:
             # Not in our precomputed DB -> treat as obscure.
@@ -403,43 +478,130 @@ async def get_user_films(username: str) -> list[dict]:
     return enriched_films
 
 
-async def enrich_with_letterboxd_stats(films: list[dict]) -> list[dict]:
+def make_session(limit: int = 30, timeout: ClientTimeout | None = None) -> aiohttp.ClientSession:
+    """
+    aiohttp session for Letterboxd fetches: up to `limit` keep-alive connections to the
+    host, DNS resolved once rather than per connect, and browser headers set once.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit,
+        ttl_dns_cache=300,
+        keepalive_timeout=30,
+    )
+    return aiohttp.ClientSession(
+        timeout=timeout or ClientTimeout(total=15, connect=5),
+        connector=connector,
+        headers=BROWSER_HEADERS,
+    )
+
+
+async def enrich_with_letterboxd_stats(
+    films: list[dict],
+    on_enriched: Callable[[dict], None] | None = None,
+) -> list[dict]:
     """
     Fetch Letterboxd watch counts from the stats CSI endpoint.
     Fetches for ALL films to ensure complete data.
-    Uses smaller batches and better error handling for large collections.
+    Uses a bounded number of films in flight and per-film error handling for large collections.
+    `on_enriched` is called with each film as soon as it is done, so long jobs can save
+    as they go instead of waiting for the whole list.
     """
     if not films:
         return films
     
-    # Gentle concurrency: each film does 2 requests (stats + main page), so batch_size N
-    # means ~2N concurrent curl_cffi requests. Keep this modest to stay under Letterboxd's
-    # rate limits during large offline builds (better a slower job than a blocked one).
-    batch_size = int(os.getenv("ENRICH_BATCH_SIZE", "15"))
-    delay = float(os.getenv("ENRICH_DELAY", "0.3"))
-    
-    # Create session with optimized timeout and connection limits
-    timeout = aiohttp.ClientTimeout(total=15, connect=5)
-    connector = aiohttp.TCPConnector(limit=100, limit_per_host=50)  # Higher connection limits
+    # Gentle concurrency: each film does 2 requests (stats + main page), so N films in
+    # flight means ~2N concurrent curl_cffi requests. Keep this modest to stay under
+    # Letterboxd's rate limits during large offline builds (better a slower job than a
+    # blocked one). ENRICH_BATCH_SIZE keeps its old name but is now the in-flight limit.
+    concurrency = int(os.getenv("ENRICH_BATCH_SIZE", "15"))
+    # Rate limiting only for very large runs: a token bucket caps films started per
+    # second, so bursts can't outrun it and slots never sit out a fixed sleep
+    rate = float(os.getenv("ENRICH_RATE", "10"))
+    limiter = RateLimiter(rate, burst=concurrency) if len(films) > 100 and rate > 0 else None
+    semaphore = asyncio.Semaphore(concurrency)
     
-    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
-        for i in range(0, len(films), batch_size):
-            batch = films[i:i + batch_size]
-            tasks = [get_film_stats(session, film) for film in batch]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for film, result in zip(batch, results):
+    # One session for the whole run, pooled to what the semaphore can actually use
+    # (2 requests per film)
+    async with make_session(limit=2 * concurrency) as session:
+        # A slot frees up as soon as its film is done, rather than every batch waiting
+        # for its slowest film before the next batch starts
+        async def enrich_one(film: dict) -> None:
+            async with semaphore:
+                if limiter is not None:
+                    await limiter.acquire()
+                try:
+                    result = await get_film_stats(session, film)
+                except Exception:
+                    result = None  # Silently skip - errors are handled in get_film_stats
                 if isinstance(result, dict):
                     film.update(result)
-                # Silently skip exceptions - they're handled in get_film_stats
-            
-            # Minimal rate limiting - only for very large batches
-            if i + batch_size < len(films) and len(films) > 100:
-                await asyncio.sleep(delay)
+                if on_enriched is not None:
+                    try:
+                        on_enriched(film)
+                    except Exception as e:  # a bad callback must not abort the other films
+                        print(f"⚠️ on_enriched failed for {film.get('slug')}: {e}")
+        
+        await asyncio.gather(*(enrich_one(film) for film in films))
     
     return films
 
 
+async def enrich_and_save(
+    films: list[dict],
+    batch_size: int,
+    conn=None,
+    on_saved: Callable[[list[dict], int], None] | None = None,
+) -> int:
+    """
+    Enrich films with enrich_with_letterboxd_stats and save them `batch_size` at a time
+    as they finish, so no batch waits on its slowest film. Returns how many were saved.
+
+    Saves run in a worker thread so the event loop keeps fetching; a lock keeps them
+    one at a time, in order (on `conn` if given, as for save_films). A batch that fails
+    to save is reported and skipped. `on_saved` gets each saved batch and the running total.
+    """
+    saved = 0
+    pending = []
+    save_lock = asyncio.Lock()
+    saves = set()
+
+    async def save(batch: list):
+        nonlocal saved
+        async with save_lock:
+            try:
+                await asyncio.to_thread(save_films, batch, conn)
+            except Exception as e:
+                if conn is not None:
+                    conn.rollback()
+                print(f"   ⚠️  Could not save {len(batch)} films: {e}")
+                return
+            saved += len(batch)
+            if on_saved is not None:
+                on_saved(batch, saved)
+
+    def flush():
+        task = asyncio.create_task(save(pending[:]))
+        pending.clear()
+        saves.add(task)
+        task.add_done_callback(saves.discard)
+
+    def on_enriched(film: dict):
+        pending.append(film)
+        if len(pending) >= batch_size:
+            flush()
+
+    try:
+        await enrich_with_letterboxd_stats(films, on_enriched=on_enriched)
+    except Exception as e:
+        # Keep whatever finished; the films still pending are saved below
+        print(f"   ⚠️  Enrichment error: {e}")
+    if pending:
+        flush()
+    await asyncio.gather(*saves)
+    return saved
+
+
 async def get_film_stats(session: aiohttp.ClientSession, film: dict, retries: int = 3) -> dict:
     """
     Get Letterboxd watch count from the CSI stats endpoint.
@@ -460,66 +622,61 @@ async def get_film_stats(session: aiohttp.ClientSession, film: dict, retries: in
             stats_url = f"https://letterboxd.com/csi/film/{slug}/stats/"
             main_url = f"https://letterboxd.com/film/{slug}/"
             
-            headers = get_headers()
             stats = {}
             
+            # Both pages are in flight at once; each fetch reads its body and releases
+            # the connection itself, and a failed page just comes back empty.
+            # The stats fragment stays raw bytes: lxml decodes it in C while parsing, so
+            # there's no separate charset sniff + decode to str first.
             # Use curl_cffi browser impersonation to defeat Cloudflare fingerprinting.
             if CURL_CFFI_AVAILABLE:
                 profile = IMPERSONATE_PROFILES[attempt % len(IMPERSONATE_PROFILES)]
 
-                async def fetch_cffi(u):
-                    try:
-                        async with cffi_requests.AsyncSession() as s:
+                # One session for the pair, so the second request reuses the connection
+                async with cffi_requests.AsyncSession() as s:
+                    async def fetch_cffi(u, raw=False):
+                        try:
                             resp = await s.get(u, impersonate=profile, timeout=15, allow_redirects=True)
-                        if resp.status_code == 200:
-                            return resp.text
-                        return ""
-                    except Exception:
+                            if resp.status_code == 200:
+                                return resp.content if raw else resp.text
+                            return ""
+                        except Exception:
+                            return ""
+
+                    stats_html, main_html = await asyncio.gather(
+                        fetch_cffi(stats_url, raw=True),
+                        fetch_cffi(main_url),
+                    )
+            else:
+                # Fallback to aiohttp (the session already carries the browser headers)
+                async def fetch_aiohttp(u, raw=False):
+                    async with session.get(u) as resp:
+                        if resp.status == 200:
+                            return await resp.read() if raw else await resp.text()
                         return ""
 
                 stats_html, main_html = await asyncio.gather(
-                    fetch_cffi(stats_url),
-                    fetch_cffi(main_url),
+                    fetch_aiohttp(stats_url, raw=True),
+                    fetch_aiohttp(main_url),
                     return_exceptions=True,
                 )
 
-                # Parse stats page
-                if not isinstance(stats_html, Exception) and stats_html:
-                    if not is_cloudflare_challenge(stats_html):
-                        stats = parse_stats_html(stats_html)
+            # Parse stats page
+            if not isinstance(stats_html, Exception) and stats_html:
+                if not is_cloudflare_challenge(stats_html):
+                    stats = parse_stats_html(stats_html)
 
-                # Parse main page
-                if not isinstance(main_html, Exception) and main_html:
-                    if not is_cloudflare_challenge(main_html):
-                        main_stats = parse_film_page(main_html)
-                        stats.update({k: v for k, v in main_stats.items() if v})
-            else:
-                # Fallback to aiohttp
-                stats_task = session.get(stats_url, headers=headers)
-                main_task = session.get(main_url, headers=headers)
-                
-                stats_response, main_response = await asyncio.gather(
-                    stats_task, main_task, return_exceptions=True
-                )
-                
-                # Parse stats page
-                if not isinstance(stats_response, Exception) and stats_response.status == 200:
-                    html = await stats_response.text()
-                    if not is_cloudflare_challenge(html):
-                        stats = parse_stats_html(html)
-                
-                # Parse main page
-                if not isinstance(main_response, Exception) and main_response.status == 200:
-                    main_html = await main_response.text()
-                    if not is_cloudflare_challenge(main_html):
-                        main_stats = parse_film_page(main_html)
-                        stats.update({k: v for k, v in main_stats.items() if v})
+            # Parse main page
+            if not isinstance(main_html, Exception) and main_html:
+                if not is_cloudflare_challenge(main_html):
+                    main_stats = parse_film_page(main_html)
+                    stats.update({k: v for k, v in main_stats.items() if v})
             
             # TMDb poster lookup - skip during bulk scraping for speed
             # Can be added later via add_posters.py script
             # if stats.get('title') and stats.get('year') and not stats.get('poster_path'):
             #     try:
-            #         tmdb_poster = await get_tmdb_poster(stats.get('title'), stats.get('year'))
+            #         tmdb_poster = await get_tmdb_poster(stats.get('title'), stats.get('year'), session)
             #         if tmdb_poster:
             #             stats['poster_path'] = tmdb_poster
             #     except Exception:
@@ -540,131 +697,145 @@ async def get_film_stats(session: aiohttp.ClientSession, film: dict, retries: in
     return {}
 
 
-async def get_tmdb_poster(title: str, year: int) -> str | None:
-    """Get TMDb poster path for a film. Returns just the path (e.g., '/abc123.jpg')."""
+async def get_tmdb_poster(
+    title: str,
+    year: int,
+    session: aiohttp.ClientSession | None = None,
+) -> str | None:
+    """
+    Get TMDb poster path for a film. Returns just the path (e.g., '/abc123.jpg').
+    Pass a shared session when looking up many films so TCP/TLS connections are reused.
+    """
     if not TMDB_AVAILABLE or not TMDB_API_KEY:
         return None
     
     try:
-        timeout = ClientTimeout(total=5, connect=3)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
+        if session is not None:
             tmdb_data = await search_film(session, title, year, None)
-            if tmdb_data and tmdb_data.get('poster_path'):
-                return tmdb_data.get('poster_path')
+        else:
+            timeout = ClientTimeout(total=5, connect=3)
+            async with aiohttp.ClientSession(timeout=timeout) as own_session:
+                tmdb_data = await search_film(own_session, title, year, None)
+        if tmdb_data and tmdb_data.get('poster_path'):
+            return tmdb_data.get('poster_path')
     except:
         pass
     
     return None
 
 
-def parse_stats_html(html: str) -> dict:
+# Text is handed to lxml as UTF-8 bytes: lxml refuses str input that starts with an
+# <?xml encoding=...?> declaration, and bytes without an explicit encoding get guessed as latin-1
+_UTF8_HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+
+def _parse_html(html: str | bytes):
+    """lxml.html.fromstring that also accepts str pages carrying an XML encoding declaration."""
+    if isinstance(html, str):
+        return lxml.html.fromstring(html.encode('utf-8'), parser=_UTF8_HTML_PARSER)
+    return lxml.html.fromstring(html)
+
+
+def parse_stats_html(html: str | bytes) -> dict:
     """
     Parse the CSI stats endpoint response.
     Format: <div class="production-statistic -watches" aria-label="Watched by 6,234,540&nbsp;members">
     """
-    soup = BeautifulSoup(html, 'lxml')
+    # This runs once per film, so it skips BeautifulSoup: lxml builds the (tiny) tree in
+    # C and precompiled XPath pulls the three aria-labels straight out of it.
+    try:
+        tree = _parse_html(html)
+    except (etree.ParserError, ValueError):
+        return {}
     stats = {}
     
-    # Get watch count
-    watches_div = soup.select_one('.production-statistic.-watches')
-    if watches_div:
-        aria_label = watches_div.get('aria-label', '')
-        # Extract number from "Watched by 6,234,540 members"
-        match = re.search(r'Watched by ([\d,]+)', aria_label.replace('&nbsp;', ' '))
-        if match:
-            watches_str = match.group(1).replace(',', '')
-            stats['letterboxd_watches'] = int(watches_str)
-    
-    # Get likes count
-    likes_div = soup.select_one('.production-statistic.-likes')
-    if likes_div:
-        aria_label = likes_div.get('aria-label', '')
-        match = re.search(r'Liked by ([\d,]+)', aria_label.replace('&nbsp;', ' '))
-        if match:
-            likes_str = match.group(1).replace(',', '')
-            stats['letterboxd_likes'] = int(likes_str)
-    
-    # Get list appearances
-    lists_div = soup.select_one('.production-statistic.-lists')
-    if lists_div:
-        aria_label = lists_div.get('aria-label', '')
-        match = re.search(r'Appears in ([\d,]+)', aria_label.replace('&nbsp;', ' '))
-        if match:
-            lists_str = match.group(1).replace(',', '')
-            stats['letterboxd_lists'] = int(lists_str)
+    # Extract numbers from e.g. "Watched by 6,234,540 members"
+    for key, xpath, pattern in _STAT_LABELS:
+        labels = xpath(tree)
+        if labels:
+            match = pattern.search(labels[0])
+            if match:
+                stats[key] = int(match.group(1).replace(',', ''))
     
     return stats
 
 
+def _element_text(el) -> str:
+    """Same as BeautifulSoup's get_text(strip=True): stripped text pieces, concatenated."""
+    return ''.join(t.strip() for t in el.itertext())
+
+
 def parse_film_page(html: str) -> dict:
     """Parse title, year, director, genres, and countries from the main film page."""
-    soup = BeautifulSoup(html, 'lxml')
+    # Runs once per film on a 100KB+ page but reads only a handful of nodes, so it uses
+    # lxml + precompiled XPath instead of building a full BeautifulSoup tree.
+    try:
+        tree = _parse_html(html)
+    except (etree.ParserError, ValueError):
+        return {}
+    xp = _FILM_PAGE_XPATHS
     stats = {}
     
     # Get title and year from og:title meta tag (e.g., "Film Name (2024)")
-    og_title = soup.select_one('meta[property="og:title"]')
+    og_title = xp['og_title'](tree)
     if og_title:
-        title_content = og_title.get('content', '')
+        title_content = og_title[0]
         # Extract year from title like "Film Name (2024)"
-        year_match = re.search(r'\((\d{4})\)', title_content)
+        year_match = _TITLE_YEAR_RE.search(title_content)
         if year_match:
             stats['year'] = int(year_match.group(1))
-            stats['title'] = re.sub(r'\s*\(\d{4}\)\s*$', '', title_content).strip()
+            stats['title'] = _TRAILING_YEAR_RE.sub('', title_content).strip()
         else:
             stats['title'] = title_content.strip()
     
     # Also try h1.headline-1 as fallback
     if not stats.get('title'):
-        h1 = soup.select_one('h1.headline-1 .name, h1.headline-1')
+        h1 = xp['headline'](tree)
         if h1:
-            title_text = h1.get_text(strip=True)
-            year_match = re.search(r'\((\d{4})\)', title_text)
+            title_text = _element_text(h1[0])
+            year_match = _TITLE_YEAR_RE.search(title_text)
             if year_match:
                 stats['year'] = int(year_match.group(1))
-                stats['title'] = re.sub(r'\s*\(\d{4}\)\s*$', '', title_text).strip()
+                stats['title'] = _TRAILING_YEAR_RE.sub('', title_text).strip()
             else:
                 stats['title'] = title_text
     
     # Get year from release date if not found in title
     if not stats.get('year'):
         # Try to find year in various places
-        year_elem = soup.select_one('a[href*="/films/year/"]')
+        year_elem = xp['year_link'](tree)
         if year_elem:
-            year_text = year_elem.get_text(strip=True)
-            year_match = re.search(r'(\d{4})', year_text)
+            year_text = _element_text(year_elem[0])
+            year_match = _YEAR_RE.search(year_text)
             if year_match:
                 stats['year'] = int(year_match.group(1))
     
     # Get poster image from og:image (Letterboxd poster)
-    og_image = soup.select_one('meta[property="og:image"]')
-    if og_image:
-        image_url = og_image.get('content', '')
-        if image_url:
-            stats['poster_path'] = image_url
+    og_image = xp['og_image'](tree)
+    if og_image and og_image[0]:
+        stats['poster_path'] = og_image[0]
     
     # Get director
-    director_link = soup.select_one('a[href*="/director/"]')
+    director_link = xp['director'](tree)
     if director_link:
-        stats['director'] = director_link.get_text(strip=True)
+        stats['director'] = _element_text(director_link[0])
     
     # Get genres
-    genre_links = soup.select('#tab-genres a.text-slug')
+    genre_links = xp['genres'](tree)
     if genre_links:
         # Filter out the "Show All" and category-type genres
-        stats['genres'] = [
-            g.get_text(strip=True) for g in genre_links[:5]
-            if not g.get_text(strip=True).startswith('Show')
-        ]
+        genre_names = [_element_text(g) for g in genre_links[:5]]
+        stats['genres'] = [g for g in genre_names if not g.startswith('Show')]
     
     # Get countries
-    country_links = soup.select('a[href*="/films/country/"]')
+    country_links = xp['countries'](tree)
     if country_links:
-        stats['production_countries'] = [c.get_text(strip=True) for c in country_links]
+        stats['production_countries'] = [_element_text(c) for c in country_links]
     
     # Get letterboxd rating
-    rating_meta = soup.select_one('meta[name="twitter:data2"]')
+    rating_meta = xp['rating'](tree)
     if rating_meta:
-        rating_text = rating_meta.get('content', '')
+        rating_text = rating_meta[0]
         try:
             rating_value = float(rating_text.split()[0])
             stats['letterboxd_rating'] = rating_value
@@ -674,24 +845,39 @@ def parse_film_page(html: str) -> dict:
     return stats
 
 
+# Headers to mimic a browser request
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',  # Note: removed 'br' (brotli) as cloudscraper may not decode it properly
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Cache-Control': 'max-age=0',
+}
+
+
 def get_headers() -> dict:
-    """Return headers to mimic a browser request."""
-    return {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate',  # Note: removed 'br' (brotli) as cloudscraper may not decode it properly
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none',
-        'Cache-Control': 'max-age=0',
-    }
+    """Return headers to mimic a browser request (a copy of BROWSER_HEADERS)."""
+    return dict(BROWSER_HEADERS)
 
 
-def is_cloudflare_challenge(html: str) -> bool:
-    """Check if the HTML response is a Cloudflare challenge page."""
+# Strong indicators that ONLY appear on challenge pages (not normal pages)
+_CHALLENGE_MARKERS = (
+    'just a moment',
+    'checking your browser',
+    'enable javascript and cookies to continue',
+    'cf-browser-verification',
+    'cf-spinner',
+)
+_CHALLENGE_MARKERS_BYTES = tuple(m.encode() for m in _CHALLENGE_MARKERS)
+
+
+def is_cloudflare_challenge(html: str | bytes) -> bool:
+    """Check if the HTML response (text or raw bytes) is a Cloudflare challenge page."""
     if not html:
         return False
     
@@ -701,17 +887,9 @@ def is_cloudflare_challenge(html: str) -> bool:
         return False
     
     html_lower = html.lower()
+    markers = _CHALLENGE_MARKERS_BYTES if isinstance(html, bytes) else _CHALLENGE_MARKERS
     
-    # Strong indicators that ONLY appear on challenge pages (not normal pages)
-    strong_indicators = [
-        'just a moment',
-        'checking your browser',
-        'enable javascript and cookies to continue',
-        'cf-browser-verification',
-        'cf-spinner',
-    ]
-    
-    for indicator in strong_indicators:
+    for indicator in markers:
         if indicator in html_lower:
             return True
     
@@ -886,6 +1064,8 @@ class LetterboxdClient:
             raise Exception("404 Not Found: User or page does not exist")
         if status == 403:
             raise Exception("CLOUDFLARE_BLOCKED: 403 Forbidden")
+        if status == 429:
+            raise RateLimitedError(retry_after_seconds(resp.headers))
         if status != 200:
             raise Exception(f"HTTP {status} error")
 
@@ -905,6 +1085,7 @@ class LetterboxdClient:
         """
         print(f"🌐 Attempting to fetch: {url}")
         last_error = "CLOUDFLARE_BLOCKED: 403 Forbidden"
+        request_headers = get_headers()
 
         if CURL_CFFI_AVAILABLE:
             for attempt in range(retries):
@@ -924,24 +1105,23 @@ class LetterboxdClient:
                     if attempt < retries - 1:
                         self.rotate_profile()
                         # Exponential backoff with jitter — short fixed sleeps get us banned again.
-                        delay = (1.2 * (2 ** attempt)) + random.random() * 1.5
-                        await asyncio.sleep(delay)
+                        # A 429 tells us how long to wait, so honour that when it's longer.
+                        await asyncio.sleep(backoff_delay(attempt, getattr(e, "retry_after", None)))
 
             print(f"⚠️  curl_cffi exhausted retries for {url}: {last_error}")
 
-            managed_html = await fetch_with_managed_scraper(url, get_headers())
+            managed_html = await fetch_with_managed_scraper(url, request_headers)
             if managed_html:
                 return managed_html
             print("   Falling back to aiohttp...")
         else:
             print("⚠️  curl_cffi unavailable, trying managed scraper / aiohttp...")
-            managed_html = await fetch_with_managed_scraper(url, get_headers())
+            managed_html = await fetch_with_managed_scraper(url, request_headers)
             if managed_html:
                 return managed_html
 
         # Plain aiohttp last resort (usually blocked on datacenter IPs).
         timeout = ClientTimeout(total=30, connect=10)
-        request_headers = get_headers()
         async with aiohttp.ClientSession(timeout=timeout) as session:
             async with session.get(url, headers=request_headers) as response:
                 if response.status == 404:
@@ -987,7 +1167,7 @@ async def _fetch_curl_cffi(url: str, retries: int = FETCH_RETRIES) -> str:
                 )
                 if attempt < retries - 1:
                     client.rotate_profile()
-                    await asyncio.sleep(1.2 * (2 ** attempt) + random.random() * 1.5)
+                    await asyncio.sleep(backoff_delay(attempt, getattr(e, "retry_after", None)))
         raise Exception(last_error)
 
 
@@ -1041,7 +1221,7 @@ def parse_films_page(html: str) -> list[dict]:
         # Method 1: Extract from data-target-link attribute (2025+ structure)
         target_link = component.get('data-target-link', '')
         if target_link and '/film/' in target_link:
-            slug_match = re.search(r'/film/([^/]+)/?', target_link)
+            slug_match = _FILM_SLUG_RE.search(target_link)
             if slug_match:
                 slug = slug_match.group(1)
                 film_id = component.get('data-film-id', '')
@@ -1055,10 +1235,10 @@ def parse_films_page(html: str) -> list[dict]:
             # Find the parent li and look for the film link
             parent_li = component.find_parent('li')
             if parent_li:
-                film_link = parent_li.find('a', href=re.compile(r'/film/[^/]+/?$'))
+                film_link = parent_li.find('a', href=_FILM_SLUG_END_RE)
                 if film_link:
                     href = film_link.get('href', '')
-                    slug_match = re.search(r'/film/([^/]+)/?$', href)
+                    slug_match = _FILM_SLUG_END_RE.search(href)
                     if slug_match:
                         slug = slug_match.group(1)
         else:
@@ -1075,16 +1255,16 @@ def parse_films_page(html: str) -> list[dict]:
                 # Try data-target-link first
                 target_link = component.get('data-target-link', '')
                 if target_link:
-                    slug_match = re.search(r'/film/([^/]+)/?', target_link)
+                    slug_match = _FILM_SLUG_RE.search(target_link)
                     if slug_match:
                         slug = slug_match.group(1)
                 
                 # Fall back to href
                 if not slug:
-                    link = component.find('a', href=re.compile(r'/film/'))
+                    link = component.find('a', href=_FILM_PATH_RE)
                     if link:
                         href = link.get('href', '')
-                        slug_match = re.search(r'/film/([^/]+)/?', href)
+                        slug_match = _FILM_SLUG_RE.search(href)
                         if slug_match:
                             slug = slug_match.group(1)
                             if not item_name:
@@ -1100,7 +1280,7 @@ def parse_films_page(html: str) -> list[dict]:
         year = None
         
         # Extract year from the end of the title
-        year_match = re.search(r'\((\d{4})\)$', item_name)
+        year_match = _NAME_YEAR_END_RE.search(item_name)
         if year_match:
             year = int(year_match.group(1))
             title = item_name[:year_match.start()].strip()
@@ -1162,17 +1342,17 @@ def parse_films_page(html: str) -> list[dict]:
                 for link in all_film_links[:100]:  # Increased limit
                     href = link.get('href', '')
                     # Only match direct film links, not user film pages
-                    slug_match = re.search(r'^/film/([^/]+)/?$', href)
+                    slug_match = _FILM_HREF_RE.search(href)
                     if slug_match:
                         slug = slug_match.group(1)
                         if slug not in seen_slugs:
                             seen_slugs.add(slug)
                             title_text = link.get_text(strip=True) or link.get('title', '') or slug.replace('-', ' ').title()
                             year = None
-                            year_match = re.search(r'\((\d{4})\)', title_text)
+                            year_match = _TITLE_YEAR_RE.search(title_text)
                             if year_match:
                                 year = int(year_match.group(1))
-                                title_text = re.sub(r'\s*\(\d{4}\)\s*', '', title_text).strip()
+                                title_text = _YEAR_PAREN_RE.sub('', title_text).strip()
                             
                             if not title_text:
                                 title_text = slug.replace('-', ' ').title()
@@ -1189,21 +1369,29 @@ def parse_films_page(html: str) -> list[dict]:
     return films
 
 
+_POPULAR_SLUG_XPATH = etree.XPath('//*[@data-film-slug or @data-item-slug or @data-target-link]')
+
+
 def parse_popular_slugs(html: str) -> list[str]:
     """
     Parse film slugs from the popular-films CSI list endpoint
     (/csi/films/films-browser-list/popular/page/N/). Returns slugs in popularity order.
     """
-    soup = BeautifulSoup(html, 'lxml')
+    # Called once per list page across hundreds of pages, and only reads attributes, so
+    # it uses lxml directly rather than building a BeautifulSoup tree.
+    try:
+        elements = _POPULAR_SLUG_XPATH(_parse_html(html))
+    except (etree.ParserError, ValueError):
+        elements = []
     slugs = []
     seen = set()
 
     # Poster components expose the slug via data attributes or a /film/<slug>/ target link.
-    for el in soup.select('[data-film-slug], [data-item-slug], [data-target-link]'):
+    for el in elements:
         slug = el.get('data-film-slug') or el.get('data-item-slug') or ''
         if not slug:
             target = el.get('data-target-link', '')
-            m = re.search(r'/film/([^/]+)/', target)
+            m = _FILM_SLUG_DIR_RE.search(target)
             if m:
                 slug = m.group(1)
         if slug and slug not in seen:
@@ -1212,7 +1400,7 @@ def parse_popular_slugs(html: str) -> list[str]:
 
     # Fallback: pull slugs from any /film/<slug>/ links in the markup.
     if not slugs:
-        for slug in re.findall(r'/film/([a-z0-9:.-]+)/', html):
+        for slug in _FILM_SLUG_IN_HTML_RE.findall(html):
             if slug not in seen:
                 seen.add(slug)
                 slugs.append(slug)
@@ -1220,39 +1408,63 @@ def parse_popular_slugs(html: str) -> list[str]:
     return slugs
 
 
-async def get_popular_film_slugs(pages: int, delay: float = 0.3) -> list[str]:
+async def iter_popular_film_slugs(pages: int, delay: float = 0.3):
     """
-    Fetch slugs of the most-watched films from Letterboxd's popular list.
+    Yield each page of Letterboxd's popular list as it arrives, as the slugs not seen
+    on an earlier page, so callers can start on them while the next page is fetched.
 
     Uses the CSI list endpoint (72 films/page) which is what /films/popular/ lazy-loads.
     Intended to be run offline (locally) to build the watch-count database.
     """
-    all_slugs = []
     seen = set()
+    # Page fetches start at most once per `delay` seconds
+    limiter = RateLimiter(1 / delay) if delay > 0 else None
 
     async with LetterboxdClient(warm=True) as client:
-        for page in range(1, pages + 1):
+        async def fetch_page(page: int) -> str:
+            if limiter is not None:
+                await limiter.acquire()
             url = f"https://letterboxd.com/csi/films/films-browser-list/popular/page/{page}/?esiAllowFilters=true"
-            try:
-                print(f"📡 Fetching popular page {page}/{pages}...")
-                html = await client.fetch(url)
-            except Exception as e:
-                print(f"   ⚠️ Failed to fetch popular page {page}: {e}")
-                break
-
-            page_slugs = parse_popular_slugs(html)
-            if not page_slugs:
-                print(f"   ⚠️ No slugs on page {page}, stopping (reached the end or blocked).")
-                break
+            print(f"📡 Fetching popular page {page}/{pages}...")
+            return await client.fetch(url)
 
-            new = [s for s in page_slugs if s not in seen]
-            for s in new:
-                seen.add(s)
-            all_slugs.extend(new)
-            print(f"   Found {len(page_slugs)} films ({len(all_slugs)} unique total)")
+        # The next page is fetched while the caller works on this one. Only one fetch is
+        # ever in flight, since the client's profile rotation and rewarm aren't safe to
+        # run under other requests on the same session.
+        next_fetch = asyncio.create_task(fetch_page(1))
+        try:
+            for page in range(1, pages + 1):
+                try:
+                    html = await next_fetch
+                except Exception as e:
+                    print(f"   ⚠️ Failed to fetch popular page {page}: {e}")
+                    return
+                next_fetch = asyncio.create_task(fetch_page(page + 1)) if page < pages else None
+
+                page_slugs = parse_popular_slugs(html)
+                if not page_slugs:
+                    print(f"   ⚠️ No slugs on page {page}, stopping (reached the end or blocked).")
+                    return
+
+                new = [s for s in page_slugs if s not in seen]
+                if not new:
+                    # Past the end Letterboxd can serve an earlier page again instead of nothing
+                    print(f"   ⚠️ Page {page} repeats films already seen, stopping.")
+                    return
+                seen.update(new)
+                print(f"   Found {len(page_slugs)} films ({len(seen)} unique total)")
+                yield new
+        finally:
+            if next_fetch is not None and not next_fetch.done():
+                next_fetch.cancel()
+                await asyncio.gather(next_fetch, return_exceptions=True)
 
-            await asyncio.sleep(delay + random.random() * 0.2)
 
+async def get_popular_film_slugs(pages: int, delay: float = 0.3) -> list[str]:
+    """Fetch slugs of the most-watched films from Letterboxd's popular list, in order."""
+    all_slugs = []
+    async for page_slugs in iter_popular_film_slugs(pages, delay):
+        all_slugs.extend(page_slugs)
     return all_slugs
 
 
@@ -1264,5 +1476,5 @@ async def get_film_letterboxd_stats(session: aiohttp.ClientSession, film: dict)
 
 async def get_film_details(slug: str) -> dict:
     """Get detailed information about a specific film."""
-    async with aiohttp.ClientSession() as session:
+    async with make_session(limit=2) as session:
         return await get_film_stats(session, {'slug': slug})
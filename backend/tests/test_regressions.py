@@ -1,15 +1,26 @@
+import asyncio
+import os
+import re
+import sqlite3
+import tempfile
 import unittest
 from unittest.mock import AsyncMock, patch
 
+import httpx
 from fastapi.testclient import TestClient
 
+import backoff
+import database
 import main
+import populate_local
 import scraper
+import tmdb
 
 
 class AnalyzeEndpointTests(unittest.TestCase):
     def setUp(self) -> None:
         self.client = TestClient(main.app)
+        main._analyze_cache.clear()
 
     def test_analyze_success(self) -> None:
         sample_films = [
@@ -61,6 +72,53 @@ class AnalyzeEndpointTests(unittest.TestCase):
         self.assertIn("obscurity_score", payload)
         self.assertIn("films_by_decade", payload)
 
+    def test_analyze_reuses_cached_result_until_refresh(self) -> None:
+        sample_films = [
+            {
+                "title": "Film A",
+                "year": 1999,
+                "slug": "film-a",
+                "letterboxd_watches": 1_000_000,
+                "genres": ["Drama"],
+                "production_countries": ["USA"],
+            },
+        ]
+        get_user_films_mock = AsyncMock(return_value=sample_films)
+
+        with patch.object(main, "get_user_films", new=get_user_films_mock):
+            first = self.client.post("/analyze", json={"username": "TestUser"})
+            second = self.client.post("/analyze", json={"username": "testuser"})
+            self.assertEqual(get_user_films_mock.await_count, 1)
+            self.client.post("/analyze?refresh=true", json={"username": "testuser"})
+
+        self.assertEqual(get_user_films_mock.await_count, 2)
+        self.assertEqual(first.json(), second.json())
+
+    def test_concurrent_analyses_of_same_user_share_one_scrape(self) -> None:
+        sample_films = [{"title": "Film A", "year": 1999, "slug": "film-a", "letterboxd_watches": 10}]
+
+        async def slow_get_user_films(username: str) -> list[dict]:
+            await asyncio.sleep(0.05)
+            return sample_films
+
+        get_user_films_mock = AsyncMock(side_effect=slow_get_user_films)
+
+        async def run() -> list:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(
+                    client.post("/analyze", json={"username": "testuser"}),
+                    client.post("/analyze", json={"username": "TestUser"}),
+                )
+
+        with patch.object(main, "get_user_films", new=get_user_films_mock):
+            responses = asyncio.run(run())
+
+        self.assertEqual(get_user_films_mock.await_count, 1)
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(responses[0].json(), responses[1].json())
+        self.assertEqual(main._analyze_inflight, {})
+
     def test_analyze_empty_username(self) -> None:
         response = self.client.post("/analyze", json={"username": "   "})
         self.assertEqual(response.status_code, 400)
@@ -118,6 +176,21 @@ class AnalyzeEndpointTests(unittest.TestCase):
         self.assertTrue(payload["is_partial_data"])
         self.assertIn("only recent RSS films were analyzed", payload["data_note"])
 
+    def test_failed_database_setup_returns_503(self) -> None:
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        failed = loop.create_future()
+        failed.set_exception(RuntimeError("download failed"))
+
+        with patch.object(main, "_db_ready_task", failed):
+            response = self.client.get("/stats")
+            health = self.client.get("/health")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(health.status_code, 503)
+        self.assertEqual(health.json()["status"], "unavailable")
+        self.assertEqual(self.client.get("/health").status_code, 200)
+
 
 class ScraperRegressionTests(unittest.IsolatedAsyncioTestCase):
     async def test_get_user_films_ignores_404_substring_in_valid_html(self) -> None:
@@ -229,6 +302,64 @@ class ScraperRegressionTests(unittest.IsolatedAsyncioTestCase):
         self.assertGreaterEqual(client.fetch.await_count, 3)
         client.rewarm.assert_awaited()
 
+    async def test_enrich_and_save_saves_batches_and_skips_failed_ones(self) -> None:
+        films = [{"slug": f"film-{i}"} for i in range(5)]
+
+        async def fake_enrich(films: list[dict], on_enriched=None) -> list[dict]:
+            for film in films:
+                on_enriched(film)
+            return films
+
+        batches = []
+
+        def fake_save(batch: list[dict], conn=None) -> None:
+            if batch[0]["slug"] == "film-2":
+                raise RuntimeError("database is locked")
+            batches.append([f["slug"] for f in batch])
+
+        progress = []
+        with patch.object(scraper, "enrich_with_letterboxd_stats", new=fake_enrich), patch.object(
+            scraper, "save_films", new=fake_save
+        ):
+            saved = await scraper.enrich_and_save(
+                films, batch_size=2, on_saved=lambda batch, total: progress.append(total)
+            )
+
+        self.assertEqual(saved, 3)
+        self.assertEqual(batches, [["film-0", "film-1"], ["film-4"]])
+        self.assertEqual(progress, [2, 3])
+
+    async def test_popular_pages_prefetch_one_at_a_time(self) -> None:
+        pages = {1: ["a", "b"], 2: ["c"], 3: ["c"], 4: ["d"]}
+        fetched = []
+        in_flight = 0
+        max_in_flight = 0
+
+        class FakeClient:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc) -> None:
+                return None
+
+            async def fetch(self, url: str) -> str:
+                nonlocal in_flight, max_in_flight
+                page = int(url.split("/page/")[1].split("/")[0])
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+                await asyncio.sleep(0)
+                in_flight -= 1
+                fetched.append(page)
+                return "".join(f'<div data-film-slug="{slug}"></div>' for slug in pages[page])
+
+        with patch.object(scraper, "LetterboxdClient", lambda warm: FakeClient()):
+            result = [new async for new in scraper.iter_popular_film_slugs(4, delay=0)]
+
+        # Page 3 repeats page 2, so paging stops there; page 4 is never requested
+        self.assertEqual(result, [["a", "b"], ["c"]])
+        self.assertEqual(max_in_flight, 1)
+        self.assertNotIn(4, fetched)
+
     async def test_managed_scraper_prefers_explicit_provider(self) -> None:
         with patch.dict("os.environ", {"SCRAPER_PROVIDER": "scrapingbee"}, clear=False), patch.object(
             scraper, "fetch_with_scrapingbee", new=AsyncMock(return_value="<html>ok</html>")
@@ -254,5 +385,317 @@ class ScraperRegressionTests(unittest.IsolatedAsyncioTestCase):
         zenrows_mock.assert_awaited_once()
 
 
+class ParserTests(unittest.TestCase):
+    XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>\n'
+
+    STATS_HTML = (
+        '<div class="production-statistic -watches" aria-label="Watched by 6,234,540&nbsp;members"></div>'
+        '<div class="production-statistic -likes" aria-label="Liked by 1,203&nbsp;members"></div>'
+        '<div class="production-statistic -lists" aria-label="Appears in 48,001&nbsp;lists"></div>'
+    )
+
+    FILM_HTML = (
+        '<html><head>'
+        '<meta property="og:title" content="Amélie (2001)">'
+        '<meta property="og:image" content="https://a.example/amelie.jpg">'
+        '<meta name="twitter:data2" content="4.05 out of 5">'
+        '</head><body>'
+        '<a href="/director/jean-pierre-jeunet/">Jean-Pierre Jeunet</a>'
+        '<div id="tab-genres"><a class="text-slug" href="/films/genre/comedy/">Comedy</a>'
+        '<a class="text-slug" href="/films/genre/romance/">Romance</a></div>'
+        '<a href="/films/country/france/">France</a><a href="/films/country/germany/">Germany</a>'
+        '</body></html>'
+    )
+
+    POPULAR_HTML = (
+        '<ul><li><div data-film-slug="amelie"></div></li>'
+        '<li><div data-target-link="/film/in-the-mood-for-love/"></div></li>'
+        '<li><div data-target-link="/film/no-trailing-slash"></div></li>'
+        '<li><div data-item-slug="amelie"></div></li></ul>'
+    )
+
+    def test_parse_stats_html(self) -> None:
+        expected = {"letterboxd_watches": 6_234_540, "letterboxd_likes": 1_203, "letterboxd_lists": 48_001}
+        self.assertEqual(scraper.parse_stats_html(self.STATS_HTML), expected)
+        self.assertEqual(scraper.parse_stats_html(self.STATS_HTML.encode()), expected)
+        self.assertEqual(scraper.parse_stats_html(self.XML_DECLARATION + self.STATS_HTML), expected)
+        self.assertEqual(scraper.parse_stats_html(""), {})
+
+    def test_parse_film_page(self) -> None:
+        expected = {
+            "title": "Amélie",
+            "year": 2001,
+            "poster_path": "https://a.example/amelie.jpg",
+            "director": "Jean-Pierre Jeunet",
+            "genres": ["Comedy", "Romance"],
+            "production_countries": ["France", "Germany"],
+            "letterboxd_rating": 4.05,
+        }
+        self.assertEqual(scraper.parse_film_page(self.FILM_HTML), expected)
+        self.assertEqual(scraper.parse_film_page(self.XML_DECLARATION + self.FILM_HTML), expected)
+        self.assertEqual(scraper.parse_film_page(""), {})
+
+    def test_parse_popular_slugs(self) -> None:
+        expected = ["amelie", "in-the-mood-for-love"]
+        self.assertEqual(scraper.parse_popular_slugs(self.POPULAR_HTML), expected)
+        self.assertEqual(scraper.parse_popular_slugs(self.XML_DECLARATION + self.POPULAR_HTML), expected)
+
+    def test_parse_popular_slugs_falls_back_to_links(self) -> None:
+        html = '<p><a href="/film/amelie/">Amélie</a> <a href="/film/no-trailing-slash">x</a></p>'
+        self.assertEqual(scraper.parse_popular_slugs(html), ["amelie"])
+        self.assertEqual(scraper.parse_popular_slugs(""), [])
+
+
+class TempDatabaseMixin:
+    """Points database.DB_PATH at a fresh, initialised file for each test."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmpdir.name, "films.db")
+        self.db_patch = patch.object(database, "DB_PATH", db_path)
+        self.db_patch.start()
+        database.init_database()
+
+    def tearDown(self) -> None:
+        database.close_db_connections()
+        self.db_patch.stop()
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+
+class DatabaseWriteTests(TempDatabaseMixin, unittest.TestCase):
+
+    def test_save_films_inserts_and_updates_in_one_call(self) -> None:
+        database.save_films([
+            {"slug": "film-a", "title": "Film A", "year": 1999, "letterboxd_watches": 10, "genres": ["Drama"]},
+            {"slug": "film-b", "title": "Film B", "year": 2001},
+        ])
+        database.save_films([{"slug": "film-a", "letterboxd_watches": 20}])
+
+        films = database.get_films_by_slugs(["film-a", "film-b"])
+        self.assertEqual(films["film-a"]["title"], "Film A")
+        self.assertEqual(films["film-a"]["year"], 1999)
+        self.assertEqual(films["film-a"]["letterboxd_watches"], 20)
+        self.assertEqual(films["film-b"]["year"], 2001)
+
+    def test_save_films_skips_untitled_new_film_without_losing_batch(self) -> None:
+        database.save_films([
+            {"slug": "film-a", "title": "Film A"},
+            {"slug": "no-title", "letterboxd_watches": 5},
+            {"slug": "film-c", "title": "Film C"},
+        ])
+
+        films = database.get_films_by_slugs(["film-a", "no-title", "film-c"])
+        self.assertEqual(set(films), {"film-a", "film-c"})
+
+    def test_save_films_update_ignores_empty_title_and_director(self) -> None:
+        database.save_films([{"slug": "film-a", "title": "Film A", "director": "Jane Doe"}])
+        database.save_films([{"slug": "film-a", "title": None, "director": "", "letterboxd_watches": 7}])
+
+        film = database.get_film_by_slug("film-a")
+        self.assertEqual(film["title"], "Film A")
+        self.assertEqual(film["director"], "Jane Doe")
+        self.assertEqual(film["letterboxd_watches"], 7)
+
+    def test_cached_lookups_see_later_saves(self) -> None:
+        self.assertEqual(database.get_films_by_slugs(["film-a"]), {})
+        database.save_films([{"slug": "film-a", "title": "Film A", "letterboxd_watches": 1}])
+        self.assertEqual(database.get_films_by_slugs(["film-a"])["film-a"]["letterboxd_watches"], 1)
+
+        database.get_film_by_slug("film-a")["genres"].append("Mutated")
+        database.save_films([{"slug": "film-a", "letterboxd_watches": 2}])
+        film = database.get_film_by_slug("film-a")
+        self.assertEqual(film["letterboxd_watches"], 2)
+        self.assertEqual(film["genres"], [])
+
+    def test_lookups_see_films_added_by_another_process(self) -> None:
+        self.assertIsNone(database.get_film_by_slug("film-a"))
+        self.assertEqual(database.get_films_by_slugs(["film-a"]), {})
+
+        # A separate connection stands in for refresh_db/populate_local, bypassing save_films
+        with sqlite3.connect(database.DB_PATH) as other:
+            other.execute("INSERT INTO films (letterboxd_slug, title) VALUES ('film-a', 'Film A')")
+        other.close()
+
+        self.assertEqual(database.get_film_by_slug("film-a")["title"], "Film A")
+        self.assertIn("film-a", database.get_films_by_slugs(["film-a"]))
+
+
+class FilmsEndpointTests(TempDatabaseMixin, unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        database.save_films([
+            {"slug": "film-a", "title": "Film A", "letterboxd_watches": 300, "genres": ["Drama"]},
+            {"slug": "film-b", "title": "Film B", "letterboxd_watches": 200},
+            {"slug": "film-c", "title": "Film C", "letterboxd_watches": 200},
+            {"slug": "film-d", "title": "Film D", "letterboxd_watches": 100},
+            {"slug": "film-e", "title": "Film E"},
+            {"slug": "film-f", "title": "Film F"},
+        ])
+        self.client = TestClient(main.app)
+
+    def test_keyset_pages_follow_next_after(self) -> None:
+        first = self.client.get("/films?limit=2").json()
+        self.assertEqual(first["total"], 6)
+        self.assertEqual([f["slug"] for f in first["films"]], ["film-a", "film-c"])
+        self.assertEqual(first["films"][0]["genres"], ["Drama"])
+        self.assertEqual(first["next_after"], {"after_watches": 200, "after_slug": "film-c"})
+
+        second = self.client.get("/films", params={"limit": 2, **first["next_after"]}).json()
+        self.assertIsNone(second["offset"])
+        self.assertEqual([f["slug"] for f in second["films"]], ["film-b", "film-d"])
+
+        by_offset = self.client.get("/films?limit=2&offset=2").json()
+        self.assertEqual(by_offset["films"], second["films"])
+
+    def test_walking_next_after_reaches_every_film(self) -> None:
+        for limit in (1, 2, 3, 4):
+            with self.subTest(limit=limit):
+                slugs = []
+                params = {"limit": limit}
+                while True:
+                    page = self.client.get("/films", params=params).json()
+                    slugs += [f["slug"] for f in page["films"]]
+                    if page["next_after"] is None:
+                        break
+                    cursor = {k: v for k, v in page["next_after"].items() if v is not None}
+                    params = {"limit": limit, **cursor}
+
+                everything = self.client.get("/films?limit=50").json()
+                self.assertEqual(slugs, [f["slug"] for f in everything["films"]])
+                self.assertEqual(len(slugs), everything["total"])
+                self.assertEqual(slugs[-2:], ["film-f", "film-e"])
+
+    def test_streamed_pages_match_plain_pages(self) -> None:
+        queries = ["limit=3", "limit=5&offset=1", "limit=6", "limit=4&after_watches=200&after_slug=film-c"]
+        for query in queries:
+            with self.subTest(query=query):
+                plain = self.client.get(f"/films?{query}").json()
+                with patch.object(main, "FILMS_STREAM_BATCH", 2):
+                    streamed = self.client.get(f"/films?{query}").json()
+                self.assertEqual(streamed, plain)
+
+    def test_streamed_page_query_error_is_a_500(self) -> None:
+        client = TestClient(main.app, raise_server_exceptions=False)
+        with patch.object(main, "FILMS_STREAM_BATCH", 1), patch.object(
+            main, "_select_films", side_effect=sqlite3.OperationalError("disk I/O error")
+        ):
+            response = client.get("/films?limit=3")
+        self.assertEqual(response.status_code, 500)
+
+    def test_films_revalidates_with_weak_etag(self) -> None:
+        response = self.client.get("/films?limit=2")
+        etag = response.headers["etag"]
+        self.assertRegex(etag, r'^W/"[0-9a-f]+"$')
+        self.assertIn("max-age", response.headers["cache-control"])
+
+        cached = self.client.get("/films?limit=2", headers={"If-None-Match": f'"other", {etag}'})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b"")
+        self.assertEqual(cached.headers["etag"], etag)
+
+        other_page = self.client.get("/films?limit=3", headers={"If-None-Match": etag})
+        self.assertEqual(other_page.status_code, 200)
+        self.assertNotEqual(other_page.headers["etag"], etag)
+
+        stats = self.client.get("/stats")
+        self.assertEqual(
+            self.client.get("/stats", headers={"If-None-Match": stats.headers["etag"]}).status_code, 304
+        )
+
+
+class SlugifyTitleTests(unittest.TestCase):
+    @staticmethod
+    def regex_slugify(title: str) -> str:
+        slug = title.lower()
+        slug = re.sub(r'[^a-z0-9\s-]', '', slug)
+        slug = re.sub(r'\s+', '-', slug)
+        slug = re.sub(r'-+', '-', slug)
+        return slug.strip('-')
+
+    def test_matches_regex_slugify(self) -> None:
+        titles = [
+            "The Thing!", "  Spaced   Out  ", "Amélie", "Crouching Tiger, Hidden Dragon",
+            "Mission: Impossible - Fallout", "--dashes--", "2001: A Space Odyssey",
+            "8½", "Tab\tand\nnewline", "", "!!!",
+        ]
+        for title in titles:
+            with self.subTest(title=title):
+                self.assertEqual(populate_local.slugify_title(title), self.regex_slugify(title))
+
+
+class RateLimitTests(unittest.IsolatedAsyncioTestCase):
+    async def test_rate_limiter_allows_burst_then_paces(self) -> None:
+        now = [100.0]
+        delays = []
+
+        async def fake_sleep(delay: float) -> None:
+            delays.append(delay)
+            now[0] += delay
+
+        with patch.object(backoff.time, "monotonic", lambda: now[0]), patch.object(
+            backoff.asyncio, "sleep", fake_sleep
+        ):
+            limiter = backoff.RateLimiter(rate=4, burst=2)
+            await limiter.acquire()
+            await limiter.acquire()
+            self.assertEqual(delays, [])
+
+            await asyncio.gather(*(limiter.acquire() for _ in range(3)))
+
+        self.assertEqual(delays, [0.25, 0.25, 0.25])
+
+    def test_retry_after_seconds(self) -> None:
+        self.assertEqual(backoff.retry_after_seconds({"Retry-After": "7"}), 7.0)
+        self.assertEqual(backoff.retry_after_seconds({"Retry-After": "-3"}), 0.0)
+        self.assertIsNone(backoff.retry_after_seconds({"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"}))
+        self.assertIsNone(backoff.retry_after_seconds({}))
+
+    def test_backoff_delay_is_clamped_to_max_retry_after(self) -> None:
+        with patch.object(backoff, "MAX_RETRY_AFTER", 30.0):
+            self.assertEqual(backoff.backoff_delay(0, 10_000), 30.0)
+            self.assertEqual(backoff.backoff_delay(0, 20), 20.0)
+            self.assertLess(backoff.backoff_delay(0), 3.0)
+
+    async def test_tmdb_backs_off_within_bounds_on_429(self) -> None:
+        class FakeResponse:
+            def __init__(self, status: int, headers: dict, body: bytes = b"") -> None:
+                self.status = status
+                self.headers = headers
+                self.body = body
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc) -> None:
+                return None
+
+            async def read(self) -> bytes:
+                return self.body
+
+        responses = [
+            FakeResponse(429, {"Retry-After": "99999"}),
+            FakeResponse(429, {"Retry-After": "-5"}),
+            FakeResponse(200, {}, b'{"id": 1}'),
+        ]
+        session = type("FakeSession", (), {"get": lambda self, url, params: responses.pop(0)})()
+        sleep_mock = AsyncMock()
+
+        limiter = AsyncMock()
+
+        with patch.object(backoff, "MAX_RETRY_AFTER", 30.0), patch.object(
+            tmdb.asyncio, "sleep", sleep_mock
+        ), patch.object(tmdb, "_rate_limiter", limiter):
+            result = await tmdb._tmdb_get_json(session, "https://tmdb.example/movie/1", {})
+
+        self.assertEqual(result, {"id": 1})
+        self.assertEqual(limiter.acquire.await_count, 3)
+        delays = [call.args[0] for call in sleep_mock.await_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertEqual(delays[0], 30.0)
+        self.assertTrue(0 <= delays[1] <= 30.0)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -8,12 +8,22 @@ import asyncio
 import aiohttp
 from typing import Optional
 from dotenv import load_dotenv
-from database import get_films_by_slugs, save_film
+from database import get_films_by_slugs, save_films, json_loads
+from backoff import RateLimiter, backoff_delay, retry_after_seconds
 
 load_dotenv()
 
 TMDB_API_KEY = os.getenv("TMDB_API_KEY", "")
 TMDB_BASE_URL = "https://api.themoviedb.org/3"
+# Max in-flight film enrichments; 429s are handled by backoff in _tmdb_get_json.
+TMDB_CONCURRENCY = int(os.getenv("TMDB_CONCURRENCY", "20"))
+TMDB_MAX_RETRIES = 3
+# Requests started per second across the process (TMDb allows roughly 50 per API key);
+# 429s past this still back off in _tmdb_get_json
+TMDB_RATE = float(os.getenv("TMDB_RATE", "40"))
+_rate_limiter = RateLimiter(TMDB_RATE, burst=TMDB_CONCURRENCY)
+# Enriched films are written to the DB in chunks of this size as they complete
+TMDB_SAVE_BATCH = 30
 
 
 async def enrich_films_with_tmdb(films: list[dict]) -> list[dict]:
@@ -27,7 +37,7 @@ async def enrich_films_with_tmdb(films: list[dict]) -> list[dict]:
     
     # First, check database for existing films
     slugs = [f.get('slug') for f in films if f.get('slug')]
-    db_films = get_films_by_slugs(slugs)
+    db_films = await asyncio.to_thread(get_films_by_slugs, slugs)
     
     # Separate films into those we have in DB and those we need to fetch
     films_to_enrich = []
@@ -49,41 +59,40 @@ async def enrich_films_with_tmdb(films: list[dict]) -> list[dict]:
         # All films found in database!
         return enriched_from_db
     
-    # Enrich remaining films via API
-    async with aiohttp.ClientSession() as session:
-        # Process films in batches - adjust batch size based on total films
-        total_films = len(films_to_enrich)
-        if total_films > 500:
-            batch_size = 15  # Larger batches for big collections
-            delay = 0.2  # Shorter delay
-        elif total_films > 200:
-            batch_size = 10
-            delay = 0.3
-        else:
-            batch_size = 5  # Smaller batches for normal collections
-            delay = 0.5
-        
-        enriched = []
-        
-        for i in range(0, len(films_to_enrich), batch_size):
-            batch = films_to_enrich[i:i + batch_size]
-            tasks = [enrich_single_film(session, film) for film in batch]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for film, result in zip(batch, results):
-                if isinstance(result, Exception):
-                    enriched.append(film)
-                else:
-                    enriched.append(result)
-                    # Save to database for future use
-                    save_film(result)
-            
-            # Rate limiting
-            if i + batch_size < len(films_to_enrich):  # Don't sleep after last batch
-                await asyncio.sleep(delay)
-        
-    # Combine films from DB and newly enriched films
-    return enriched_from_db + enriched
+    # Enrich remaining films via API over one pooled session (keep-alive + cached DNS)
+    timeout = aiohttp.ClientTimeout(total=20, connect=5)
+    connector = aiohttp.TCPConnector(limit=50, limit_per_host=30, ttl_dns_cache=300, keepalive_timeout=60)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        # The semaphore caps concurrency; a continuous stream of tasks avoids idling
+        # at batch boundaries the way fixed-size batches + sleeps did.
+        semaphore = asyncio.Semaphore(TMDB_CONCURRENCY)
+
+        async def enrich_bounded(film: dict) -> Optional[dict]:
+            async with semaphore:
+                try:
+                    return await enrich_single_film(session, film)
+                except Exception:
+                    return None
+
+        # Handle results as they finish so a slow request never holds back saving
+        # the rest; writes go out in small transactions instead of one at the end.
+        tasks = [asyncio.create_task(enrich_bounded(film)) for film in films_to_enrich]
+        to_save = []
+        for done, next_result in enumerate(asyncio.as_completed(tasks), 1):
+            result = await next_result
+            if result is not None:
+                to_save.append(result)
+            if len(to_save) >= TMDB_SAVE_BATCH:
+                # Write on a worker thread so in-flight requests keep running meanwhile
+                await asyncio.to_thread(save_films, to_save)
+                to_save = []
+            if done % 100 == 0:
+                print(f"   TMDb: enriched {done}/{len(tasks)} films")
+        await asyncio.to_thread(save_films, to_save)
+
+    # Combine films from DB and newly enriched films (enrich_single_film updates
+    # each film in place, so films_to_enrich keeps the original order)
+    return enriched_from_db + films_to_enrich
 
 
 async def enrich_single_film(session: aiohttp.ClientSession, film: dict) -> dict:
@@ -156,20 +165,16 @@ async def search_film(
     url = f"{TMDB_BASE_URL}/search/movie"
     
     try:
-        async with session.get(url, params=params) as response:
-            if response.status != 200:
-                return None
-            
-            data = await response.json()
+        data = await _tmdb_get_json(session, url, params)
+        if data is not None:
             results = data.get('results', [])
             
             if not results and year:
                 # Try without year if no results
                 params.pop('year', None)
-                async with session.get(url, params=params) as retry_response:
-                    if retry_response.status == 200:
-                        retry_data = await retry_response.json()
-                        results = retry_data.get('results', [])
+                retry_data = await _tmdb_get_json(session, url, params)
+                if retry_data:
+                    results = retry_data.get('results', [])
             
             if not results:
                 return None
@@ -255,9 +260,6 @@ async def search_film(
                                 # Popular films are less likely to have wrong matches
                                 if pop > 10 or votes > 500:
                                     score += 20  # Boost score to accept it
-                        
-                        # Small delay to avoid rate limiting (reduced for speed)
-                        await asyncio.sleep(0.1)
                     
                     if score > best_score:
                         best_score = score
@@ -334,16 +336,32 @@ async def get_film_details(session: aiohttp.ClientSession, tmdb_id: int) -> Opti
     }
     
     try:
-        async with session.get(url, params=params) as response:
-            if response.status != 200:
-                return None
-            
-            return await response.json()
-            
+        return await _tmdb_get_json(session, url, params)
     except Exception:
         return None
 
 
+async def _tmdb_get_json(session: aiohttp.ClientSession, url: str, params: dict) -> Optional[dict]:
+    """
+    GET a TMDb endpoint and return its JSON, or None on a non-200 response.
+    Paced by a process-wide token bucket, and backs off on HTTP 429 (honouring
+    Retry-After) instead of pacing with fixed sleeps.
+    """
+    for attempt in range(TMDB_MAX_RETRIES + 1):
+        await _rate_limiter.acquire()
+        async with session.get(url, params=params) as response:
+            if response.status == 200:
+                # Raw bytes straight into orjson (when installed): no charset sniffing or
+                # str decode first, and a faster parser than aiohttp's stdlib default
+                return json_loads(await response.read())
+            if response.status != 429 or attempt == TMDB_MAX_RETRIES:
+                return None
+            # Same bounded backoff as Letterboxd: Retry-After is clamped to [0, MAX_RETRY_AFTER]
+            delay = backoff_delay(attempt, retry_after_seconds(response.headers))
+        await asyncio.sleep(delay)
+    return None
+
+
 # TMDb genre mapping
 GENRE_MAP = {
     28: "Action",